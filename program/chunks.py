@@ -0,0 +1,278 @@
+"per-tile storage for very large maps, split into chunks that are only allocated when touched"
+import os, pickle, shutil, tempfile, weakref
+from array import array
+from functools import lru_cache
+from geometry import popcount
+
+
+
+class ChunkedStore:
+    """
+    A mutable sequence with one entry per tile of a ChunkedRectangle8 geometry, indexed by tile # like a list.
+    The map is cut into square chunks (see ChunkedRectangle8.chunk_of) and a chunk's storage is only allocated
+    the first time one of its tiles is written; reading an untouched tile just returns the default.
+    Chunks can be paged out to files in page_dir (a temporary directory by default) and are paged back in,
+    unchanged, the next time one of their tiles is read or written.  Memory therefore follows the part of
+    the map that has been explored and is near the player, not the declared size of the map, as long as
+    page_out_far() is called as the player moves (GameData.move_player does it for the Level's terrain).
+    The chunk files are deleted, along with the temporary directory if the store made one, by close() or
+    when the store is garbage collected.
+    If a typecode is given each chunk is an array of that type, otherwise a list.
+    """
+
+    def __init__(self,geom,default,typecode=None,page_dir=None):
+        self._geom = geom
+        self._default = default
+        self._typecode = typecode
+        self._page_dir = page_dir
+        self._chunks = {} # chunk key -> list/array of chunk_size**2 entries, row by row within the chunk
+        self._paged = set() # keys of chunks that are on disk rather than in self._chunks
+        self._cleanup = None # a weakref.finalize that deletes the chunk files, set up when the first chunk is paged out
+        self.page_ins = 0
+        self.page_outs = 0
+
+    def __len__(self):
+        return self._geom.tilecount()
+
+    def __getitem__(self,tile):
+        key, offset = self._geom.chunk_index(tile)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            if key not in self._paged: return self._default # never written: no need to allocate it just to read
+            chunk = self._page_in(key)
+        return chunk[offset]
+
+    def __setitem__(self,tile,value):
+        key, offset = self._geom.chunk_index(tile)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._page_in(key) if key in self._paged else self._new_chunk(key)
+        chunk[offset] = value
+
+    def __iter__(self):
+        for tile in range(len(self)): yield self[tile]
+
+    def loaded(self):
+        # the keys of the chunks currently held in memory
+        return set(self._chunks)
+
+    def close(self):
+        # delete the chunk files on disk (the chunks they held are lost) and the temporary directory, if one was made
+        if self._cleanup is None: return
+        self._cleanup()
+        self._cleanup = None
+        if self._own_dir: self._page_dir = None
+
+    def page_out(self,key):
+        # write one chunk to disk and drop it from memory (does nothing if it isn't in memory)
+        chunk = self._chunks.pop(key,None)
+        if chunk is None: return
+        if self._cleanup is None:
+            self._own_dir = self._page_dir is None
+            if self._own_dir: self._page_dir = tempfile.mkdtemp(prefix="chunks")
+            self._cleanup = weakref.finalize(self,_remove_pages,self._page_dir,self._paged,self._own_dir)
+        with open(self._page_file(key),"wb") as f:
+            pickle.dump(chunk,f)
+        self._paged.add(key)
+        self.page_outs += 1
+
+    def page_out_far(self,tile,radius):
+        # page out every chunk in memory that is more than radius chunks away from the one holding the tile
+        here = self._geom.chunk_of(tile)
+        for key in list(self._chunks):
+            if max(abs(key[0]-here[0]),abs(key[1]-here[1])) > radius: self.page_out(key)
+
+    def _new_chunk(self,key):
+        size = self._geom.chunk_size()**2
+        if self._typecode is None: chunk = [self._default]*size
+        else: chunk = array(self._typecode,[self._default])*size
+        self._chunks[key] = chunk
+        return chunk
+
+    def _page_in(self,key):
+        with open(self._page_file(key),"rb") as f:
+            chunk = pickle.load(f)
+        os.remove(self._page_file(key))
+        self._paged.discard(key)
+        self._chunks[key] = chunk
+        self.page_ins += 1
+        return chunk
+
+    def _page_file(self,key):
+        return _page_file(self._page_dir,key)
+
+def _page_file(page_dir,key):
+    return os.path.join(page_dir,"%d_%d.chunk" % key)
+
+def _remove_pages(page_dir,paged,own_dir):
+    # delete a ChunkedStore's chunk files (it holds no reference to the store, so it can run as its finalizer)
+    for key in paged:
+        try: os.remove(_page_file(page_dir,key))
+        except OSError: pass
+    paged.clear()
+    if own_dir: shutil.rmtree(page_dir,ignore_errors=True)
+
+
+
+class ChunkedTileSet:
+    """
+    A set of tile #s on a ChunkedRectangle8, for the Level's change queues: one bitmap (an int) per chunk,
+    made only when something in that chunk is added or removed.  An untouched chunk counts as empty, or
+    as entirely full if the set was made with full=True, so "every tile has changed" costs nothing until
+    tiles start being taken out of it.  Supports add/discard/remove/pop, 'in', len() and iteration, and
+    &, | and - (and &=, |=, -=) with another ChunkedTileSet on the same map or any iterable of tile #s,
+    worked out one chunk bitmap at a time for the chunks either side has touched.
+    """
+
+    def __init__(self,geom,tiles=(),full=False):
+        self._geom = geom
+        self._full = full # what an untouched chunk holds: all of its tiles, or none
+        self._chunks = {} # chunk key -> int bitmap of the chunk's tiles, bit n = position n in chunk_index()
+        self._count = geom.tilecount() if full else 0
+        for tile in tiles: self.add(tile)
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __contains__(self,tile):
+        if not 0 <= tile < self._geom.tilecount(): return False
+        key, offset = self._geom.chunk_index(tile)
+        bits = self._chunks.get(key)
+        if bits is None: return self._full
+        return (bits >> offset) & 1 == 1
+
+    def __iter__(self):
+        # walks a snapshot of the chunk bitmaps, so the set may be changed while it's being walked
+        chunks = dict(self._chunks)
+        if self._full: keys = self._all_keys()
+        else: keys = sorted(chunks)
+        for key in keys:
+            bits = chunks.get(key)
+            if bits is None:
+                if self._full: yield from self._geom.chunk_rect(key)
+                continue
+            base_row, base_col = key[0]*self._geom.chunk_size(), key[1]*self._geom.chunk_size()
+            while bits:
+                low = bits & -bits
+                r,c = divmod(low.bit_length()-1,self._geom.chunk_size())
+                yield (base_row+r)*self._geom.cols() + base_col + c
+                bits ^= low
+
+    def add(self,tile):
+        if not 0 <= tile < self._geom.tilecount(): raise IndexError(tile)
+        key, offset = self._geom.chunk_index(tile)
+        bits = self._bits(key)
+        if not (bits >> offset) & 1:
+            self._chunks[key] = bits | (1 << offset)
+            self._count += 1
+
+    def discard(self,tile):
+        if tile in self:
+            key, offset = self._geom.chunk_index(tile)
+            self._chunks[key] = self._bits(key) & ~(1 << offset)
+            self._count -= 1
+
+    def remove(self,tile):
+        if tile not in self: raise KeyError(tile)
+        self.discard(tile)
+
+    def update(self,tiles):
+        for tile in tiles: self.add(tile)
+
+    def pop(self):
+        for tile in self:
+            self.discard(tile)
+            return tile
+        raise KeyError("pop from an empty ChunkedTileSet")
+
+    def copy(self):
+        result = ChunkedTileSet(self._geom,full=self._full)
+        result._chunks = dict(self._chunks)
+        result._count = self._count
+        return result
+
+    def __and__(self,other):
+        return self._combine(other,lambda a,b: a & b)
+    def __or__(self,other):
+        return self._combine(other,lambda a,b: a | b)
+    def __sub__(self,other):
+        return self._combine(other,lambda a,b: a & ~b)
+    def __iand__(self,other):
+        return self._become( self & other )
+    def __ior__(self,other):
+        return self._become( self | other )
+    def __isub__(self,other):
+        return self._become( self - other )
+
+    def _combine(self,other,op):
+        # a new set with op() applied to the two sets' bitmaps, chunk by chunk; untouched chunks on both sides
+        # stay untouched, and are full in the result if op() of the two sides' defaults is
+        other = self._coerce(other)
+        result = ChunkedTileSet(self._geom)
+        result._full = op(int(self._full),int(other._full)) & 1 == 1
+        count = self._geom.tilecount() if result._full else 0
+        for key in set(self._chunks) | set(other._chunks):
+            whole = self._chunk_mask(key)
+            bits = op( self._chunks.get(key, whole if self._full else 0), other._chunks.get(key, whole if other._full else 0) ) & whole
+            if result._full: count -= popcount(whole) - popcount(bits)
+            else: count += popcount(bits)
+            if bits != (whole if result._full else 0): result._chunks[key] = bits
+        result._count = count
+        return result
+
+    def _become(self,other):
+        # take on another set's contents (for the in-place operators)
+        self._full, self._chunks, self._count = other._full, other._chunks, other._count
+        return self
+
+    def _coerce(self,other):
+        if isinstance(other,ChunkedTileSet):
+            if other._geom.tilecount() != self._geom.tilecount(): raise ValueError("ChunkedTileSets of different maps")
+            return other
+        return ChunkedTileSet(self._geom,other)
+
+    def _chunk_mask(self,key):
+        # the bitmap with every tile of a chunk set (chunks along the top and right edges may be cut short)
+        size = self._geom.chunk_size()
+        rows = min( size, self._geom.rows() - key[0]*size )
+        cols = min( size, self._geom.cols() - key[1]*size )
+        return _chunk_mask(size,rows,cols)
+
+    def _bits(self,key):
+        # the bitmap for a chunk, making it if the chunk hasn't been touched yet
+        bits = self._chunks.get(key)
+        if bits is None:
+            bits = self._chunk_mask(key) if self._full else 0
+            self._chunks[key] = bits
+        return bits
+
+    def _all_keys(self):
+        size = self._geom.chunk_size()
+        for kr in range( (self._geom.rows()+size-1)//size ):
+            for kc in range( (self._geom.cols()+size-1)//size ):
+                yield kr,kc
+
+@lru_cache(maxsize=16)
+def _chunk_mask(size,rows,cols):
+    # a chunk bitmap (bit n = position n in chunk_index()) with the first 'cols' tiles of the first 'rows' rows set
+    row = (1 << cols) - 1
+    mask = 0
+    for r in range(rows): mask |= row << (r*size)
+    return mask
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry
+    world = geometry.ChunkedRectangle8(10000,10000)
+    store = ChunkedStore(world,".")
+    store[world.tile_at_coords(5000,5000)] = "#"
+    store[world.tile_at_coords(10,10)] = "#"
+    print( len(store), store.loaded() )
+    store.page_out_far(world.tile_at_coords(5000,5000),2)
+    print( store.loaded(), store[world.tile_at_coords(10,10)], store.loaded() )
@@ -0,0 +1,122 @@
+"field of view: which tiles can be seen from where"
+
+
+
+# Each octant is a transform (xx,xy,yx,yy) from (depth,col) within the octant to a (row,col) offset on the map:
+# drow = depth*xx + col*xy, dcol = depth*yx + col*yy.  Depth counts outwards from the origin, and col runs
+# from 0 (along the axis) to depth (along the diagonal), so tiles on an axis or diagonal belong to two octants.
+OCTANTS = ( (1,0,0,1), (0,1,1,0), (0,-1,1,0), (-1,0,0,1), (-1,0,0,-1), (0,-1,-1,0), (0,1,-1,0), (1,0,0,-1) )
+
+def octants_of(dr,dc):
+    # the octants (as indexes into OCTANTS) that contain the map offset (dr,dc), other than (0,0)
+    found = []
+    for o,(xx,xy,yx,yy) in enumerate(OCTANTS):
+        # the transforms are their own transposes' inverses, so this recovers (depth,col) within octant o
+        depth, col = dr*xx + dc*yx, dr*xy + dc*yy
+        if 0 <= col <= depth and depth > 0: found.append(o)
+    return found
+
+def scan(level,origin,octant,radius,symmetric=False):
+    # shadowcast one octant (one of OCTANTS) from the origin out to 'radius' steps, returning the set of tiles seen in it.
+    # Walls are normally seen if light reaches any part of them; with symmetric=True they are only seen if their center
+    # is in the cone, the same as floors, and then A sees B exactly when B sees A even if one of them is a wall.
+    xx,xy,yx,yy = octant
+    geom = level.geometry()
+    rows, cols = geom.rows(), geom.cols()
+    r0, c0 = divmod(origin,cols)
+    type_ids, transparent = level.terrain_ids(), level.terrain_types().transparent_table
+    seen = set()
+    # Each entry is a row still to be scanned: its depth, and the slopes (as numerator/denominator pairs)
+    # of the start and end of the light cone.  A tile at (depth,col) is in the cone if start <= col/depth <= end.
+    rowstack = [ (1, 0,1, 1,1) ]
+    while rowstack:
+        depth, sn,sd, en,ed = rowstack.pop()
+        if depth > radius: continue
+        first = (2*depth*sn + sd) // (2*sd) # depth*start, rounded with ties going up
+        last = -((ed - 2*depth*en) // (2*ed)) # depth*end, rounded with ties going down
+        previous = None # was the previous tile in this row a floor (True) or a wall (False)?
+        for col in range(first,last+1):
+            r, c = r0 + depth*xx + col*xy, c0 + depth*yx + col*yy
+            if 0 <= r < rows and 0 <= c < cols:
+                t = r*cols + c
+                floor = transparent[type_ids[t]] == 1
+                # walls are seen if light reaches any part of them, floors only if their center is in the cone
+                if (not floor and not symmetric) or (col*sd >= depth*sn and col*ed <= depth*en): seen.add(t)
+            else:
+                floor = False # treat the edge of the map like a wall, but there is nothing to see
+            if previous is False and floor:
+                sn, sd = 2*col-1, 2*depth # a wall just ended: narrow the start of the cone
+            if previous and not floor:
+                rowstack.append( (depth+1, sn,sd, 2*col-1,2*depth) ) # a wall just started: scan behind the floor before it
+            previous = floor
+        if previous: rowstack.append( (depth+1, sn,sd, en,ed) ) # the row ended on a floor: carry on outwards
+    return seen
+
+
+
+class FieldOfView:
+    """
+    Works out which tiles can be seen from an origin tile on a Level with a Rectangle8 geometry, using
+    symmetric shadowcasting (Albert Ford's variant of recursive shadowcasting) over the see-through flags of
+    the Level's terrain types: if a floor tile A can see a floor tile B then B can see A.  Opaque tiles are visible themselves but hide what's behind them.
+    The area around the origin is scanned as eight octants out to 'radius' steps, and the tiles found in
+    each octant are kept.  The FieldOfView listens to the Level's terrain changes; as long as the origin
+    doesn't move, compute() only re-scans the octants in which a tile within the radius has changed.
+    """
+
+    def __init__(self,level,radius=12):
+        self._level = level
+        self._geom = level.geometry()
+        self._radius = radius
+        self._origin = None
+        self._octant_tiles = [ set() for o in OCTANTS ] # tiles seen in each octant from the current origin
+        self._dirty = set(range(len(OCTANTS))) # octants that need to be re-scanned
+        self.visible_tiles = set()
+        self._level.add_terrain_listener(self._terrain_changed)
+
+    def close(self):
+        # stop listening to the Level (call this when the FieldOfView is no longer needed)
+        self._level.remove_terrain_listener(self._terrain_changed)
+
+    def compute(self,origin):
+        "return the set of tiles visible from the origin (including the origin itself)"
+        if origin != self._origin:
+            self._origin = origin
+            self._dirty = set(range(len(OCTANTS))) # moved: every octant has to be scanned again
+        if self._dirty:
+            for o in self._dirty:
+                self._octant_tiles[o] = scan(self._level,origin,OCTANTS[o],self._radius)
+            self._dirty = set()
+            self.visible_tiles = set.union( {origin}, *self._octant_tiles )
+        return self.visible_tiles
+
+    def can_see(self,tile):
+        # is the tile visible in the most recent compute()?
+        return tile in self.visible_tiles
+
+    def set_radius(self,radius):
+        if radius != self._radius:
+            self._radius = radius
+            self._dirty = set(range(len(OCTANTS)))
+
+    def _terrain_changed(self,tile):
+        # called by the Level when a tile's terrain changes: flag the octant(s) it lies in, if it's within range
+        if self._origin is None: return
+        dr = self._geom.row(tile) - self._geom.row(self._origin)
+        dc = self._geom.col(tile) - self._geom.col(self._origin)
+        if max(abs(dr),abs(dc)) > self._radius: return
+        self._dirty.update( octants_of(dr,dc) )
+
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry, gamedata
+    level = gamedata.Level( geometry.Rectangle8(21,21), gamedata.Grass() )
+    for r in range(5,16): level.place_terrain( gamedata.Wall(), level.geometry().tile_at_coords(r,14) )
+    fov = FieldOfView(level,radius=8)
+    seen = fov.compute( level.geometry().tile_at_coords(10,10) )
+    for r in range(20,-1,-1):
+        print( "".join( ("." if level.transparency()[t] else "#") if t in seen else " " for t in range(r*21,(r+1)*21) ) )
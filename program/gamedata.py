@@ -1,9 +1,89 @@
 "structures for holding/accessing/saving/loading data in the current game"
 import geometry
-import tiles # only used in terrain type; not needed yet
-from collections import defaultdict # used in creating dictionaries of lists/sets for quick-access indexes
+import pathfinding
+import regions
+import spatial
 from debug import error_log
 import random
+import re
+
+
+
+
+class TagRegistry:
+    """
+    Gives every tag name (e.g. "impassable", from "[impassable]" in terrains.txt) a bit of its own, so that
+    a terrain's or plant's tags can be kept as one int and tested with '&' instead of searching strings.
+    Bits are handed out as new tags turn up while the info files are read.
+    """
+    def __init__(self,*names):
+        self._bits = {}
+        for name in names: self.bit(name)
+    def bit(self,name):
+        if name not in self._bits: self._bits[name] = 1 << len(self._bits)
+        return self._bits[name]
+    def mask(self,names):
+        mask = 0
+        for name in names: mask |= self.bit(name)
+        return mask
+    def names(self,mask):
+        return [ name for name,bit in self._bits.items() if mask & bit ]
+
+def parse_tags(text):
+    # the list of tag names in an info file's tag field, e.g. "[impassable] + [built]" -> ["impassable","built"]
+    return [ tag.strip() for tag in re.findall(r"\[([^\]]*)\]",text) ]
+
+TAGS = TagRegistry("impassable","opaque","built") # the tags the game checks all the time get the lowest bits
+IMPASSABLE, OPAQUE, BUILT = TAGS.bit("impassable"), TAGS.bit("opaque"), TAGS.bit("built")
+LEVEL_FLAGS = IMPASSABLE | OPAQUE | BUILT # the tag bits each Level keeps for every tile (they fit in a byte)
+
+class TerrainRegistry:
+    """
+    Numbers the terrain types (up to 256 of them), so a Level can store one byte per tile instead of one
+    object reference.  Each Level has its own.  Terrains with the same class, name, image and tags count as
+    the same type, and the first one registered is the one handed back for that id (a flyweight shared by
+    every tile of that type); a terrain that differs in any of those gets an id of its own.
+    Everything a Level needs to know about a tile's terrain is kept per type, in 256-entry tables indexed by
+    the id: flag_table (the IMPASSABLE/OPAQUE/BUILT bits) and transparent_table (1 if it can be seen through).
+    """
+    def __init__(self):
+        self._types = [] # id -> terrain
+        self._ids = {} # (class, name, image id, tag mask) -> id
+        self.flag_table = bytearray(256) # id -> the type's LEVEL_FLAGS bits
+        self.transparent_table = bytearray(256) # id -> 1 if the type can be seen through, else 0
+    def id_of(self,terrain):
+        # the id of a terrain's type, registering it if it's new
+        key = (type(terrain),terrain.name(),getattr(terrain,"image_id",None),tag_mask(terrain))
+        if key not in self._ids:
+            if len(self._types) > 255: raise ValueError("too many terrain types to store in a byte")
+            type_id = len(self._types)
+            self._ids[key] = type_id
+            self._types.append(terrain)
+            self.flag_table[type_id] = tag_mask(terrain) & LEVEL_FLAGS
+            self.transparent_table[type_id] = see_through(terrain)
+        return self._ids[key]
+    def terrain(self,type_id):
+        return self._types[type_id]
+    def __len__(self):
+        return len(self._types)
+
+class TerrainLookup:
+    # a read-only, per-tile view of one of a TerrainRegistry's per-type tables: entry t is table[type id of tile t]
+    def __init__(self,type_ids,table):
+        self._type_ids = type_ids
+        self._table = table
+    def __len__(self):
+        return len(self._type_ids)
+    def __getitem__(self,tile):
+        return self._table[self._type_ids[tile]]
+
+def tag_mask(thing):
+    # the tag bitmask of a terrain, plant, etc. (worked out from its _tags if it doesn't have one already)
+    mask = getattr(thing,"_mask",None)
+    if mask is None:
+        tags = getattr(thing,"_tags",())
+        mask = TAGS.mask( parse_tags(tags) if isinstance(tags,str) else tags )
+    return mask
 
 
 
@@ -28,9 +108,18 @@ class GameData:
         #Each Level will have things_at/critters_at indexes.  A quick way to do a search for a nearby food
         # item, for example, would be to take the intersection of the [food] set with the 
         # [located at:level,tile] set(s) for the closest tiles until you find one.
+        # (Level.nearest_things(tile,tag="food") does this with the Level's spatial index.)
         #These indexes can be generated at runtime as we read in the thing/critter types from text files.
-        self.thing_indexes = {}
-        self.critter_indexes = {}
+        #A thing's or critter's id is its position in self._things/self._critters.  The indexes map each tag
+        # name to the set of ids of the things/critters in the game that have it (gone ones are taken out);
+        # find_things() and find_critters() combine them with the Level's spatial indexes.
+        self.thing_indexes = {} # tag name -> set of thing ids
+        self.critter_indexes = {} # tag name -> set of critter ids
+        self._thing_tiles = {} # thing id -> tile, for the things on the map
+        self._critter_tiles = {} # critter id -> tile, for the critters on the map
+        self.page_radius = 4 # on a chunked map, terrain chunks further than this many chunks from the player are paged out
+        self.scanned = 0 # candidates looked at by find_things()/find_critters() so far
+        self.last_scanned = 0 # ... and by the last one
 
     def level(self):
         return self._level
@@ -41,21 +130,106 @@ class GameData:
         
     def create_thing(self,thing,critter=None,tile=None):
         #add a new inanimate object to the game: specify either a critter's inventory or a map tile
+        #returns the thing's id
         self._things.append(thing)
-        if tile: self._level.place_thing(thing,tile) # place the thing on the map
+        thing_id = len(self._things) - 1
+        _index_tags(self.thing_indexes,thing,thing_id)
+        if tile is not None:
+            self._level.place_thing(thing,tile) # place the thing on the map
+            self._thing_tiles[thing_id] = tile
         elif critter: pass # place the thing in critter's inventory
         else: pass # create the thing but do not place it in the world
+        return thing_id
 
     def create_critter(self,critter,tile=None):
         #add a new critter to the game at a specified location
+        #returns the critter's id
         self._critters.append(critter)
-        if tile: self._level.place_critter(critter,tile) # place the critter on the map
+        critter_id = len(self._critters) - 1
+        _index_tags(self.critter_indexes,critter,critter_id)
+        if tile is not None:
+            self._level.place_critter(critter,tile) # place the critter on the map
+            self._critter_tiles[critter_id] = tile
         else: pass # create the critter but don't place it in the world
+        return critter_id
+
+    def destroy_thing(self,thing_id):
+        #take a thing out of the world and out of the indexes (it stays in self._things, as a gone thing)
+        thing = self._things[thing_id]
+        _unindex_tags(self.thing_indexes,thing,thing_id)
+        tile = self._thing_tiles.pop(thing_id,None)
+        if tile is not None:
+            self._level.remove_thing(thing,tile)
+
+    def destroy_critter(self,critter_id):
+        #take a critter out of the world and out of the indexes (it stays in self._critters, as a gone critter)
+        critter = self._critters[critter_id]
+        _unindex_tags(self.critter_indexes,critter,critter_id)
+        tile = self._critter_tiles.pop(critter_id,None)
+        if tile is not None:
+            self._level.remove_critter(critter,tile)
+
+    def move_critter(self,critter_id,tile):
+        #move a critter on the map to another tile (or onto the map, if it wasn't on it)
+        critter = self._critters[critter_id]
+        origin = self._critter_tiles.get(critter_id)
+        if origin is not None: self._level.remove_critter(critter,origin)
+        self._level.place_critter(critter,tile)
+        self._critter_tiles[critter_id] = tile
+
+    def thing_tile(self,thing_id):
+        return self._thing_tiles.get(thing_id) # None if the thing isn't on the map
+    def critter_tile(self,critter_id):
+        return self._critter_tiles.get(critter_id)
+
+    def things_tagged(self,*tags):
+        #the set of ids of the things with all of the given tags, e.g. things_tagged("food")
+        return _tagged(self.thing_indexes,tags)
+    def critters_tagged(self,*tags):
+        return _tagged(self.critter_indexes,tags)
+
+    def find_things(self,near,tags=(),radius=None,k=None):
+        #list of (tile,thing) for the things on the map with all of the given tags, nearest to tile 'near' first
+        # (like Level.nearest_things): the k nearest if k is given, and only those no more than radius away if radius is given
+        return self._find(self.thing_indexes,self._thing_tiles,self._things,self._level._things_index,near,tags,radius,k)
+    def find_critters(self,near,tags=(),radius=None,k=None):
+        return self._find(self.critter_indexes,self._critter_tiles,self._critters,self._level._critters_index,near,tags,radius,k)
+
+    def _find(self,indexes,tiles,objects,locations,near,tags,radius,k):
+        # Start from whichever side is smaller: if few ids have the tags, measure the distance to each of them;
+        # otherwise search the Level's spatial index outwards from 'near', skipping the objects without the tags.
+        tags = list(tags)
+        candidates = _tagged(indexes,tags) if tags else None
+        if candidates is not None and len(candidates) * 8 < len(locations):
+            found = []
+            for i in candidates:
+                tile = tiles.get(i)
+                if tile is None: continue # not on the map
+                d = self._level._geom.distance(near,tile)
+                if radius is None or d <= radius: found.append( (d,tile,i) )
+            found.sort()
+            if k is not None: found = found[:k]
+            self.last_scanned = len(candidates)
+            self.scanned += self.last_scanned
+            return [ (tile,objects[i]) for d,tile,i in found ]
+        tag = tags[0] if len(tags) == 1 else None
+        accept = None
+        if len(tags) > 1:
+            wanted = set(tags)
+            accept = lambda obj: wanted.issubset(_tag_names(obj))
+        before = locations.scanned
+        if k is None and radius is not None:
+            found = locations.within(near,radius,tag,accept)
+        else:
+            found = locations.nearest(near,len(locations) if k is None else k,tag,radius,accept)
+        self.last_scanned = locations.scanned - before
+        self.scanned += self.last_scanned
+        return found
         
     def look(self,tilenum):
         #return a list of objects at a tile in the order they are "seen" (i.e. top to bottom)
         #print("looking at",tilenum)
-        seen = self._level._critters_at[tilenum][::-1] + self._level._things_at[tilenum][::-1] + [self._level._terrains[tilenum]]
+        seen = self._level.critters_at(tilenum)[::-1] + self._level.things_at(tilenum)[::-1] + (self._level.terrain(tilenum),)
         output = ", ".join( [s.name() for s in seen] )
         return output
         
@@ -73,17 +247,67 @@ class GameData:
         move_to_tile = self._level._geom.adjacent( origin , direction)
         if move_to_tile is None:
             return [False,"can't move off map"]
-        elif "impassable" in self._level.terrain(move_to_tile)._tags:
+        elif not self._level.passable(move_to_tile):
             return [False,"can't move into impassable tile"]
         else:
             self._level.remove_critter( self._player, origin )
             self._level.place_critter( self._player, move_to_tile )
             self.player()._location = move_to_tile
+            self._level.page_out_far(move_to_tile,self.page_radius) # on a chunked map, keep only the chunks near the player in memory
             return [True]
 
 
 
         
+class TileStacks:
+    """
+    The stacks of things (or critters) on a Level's tiles, for the few tiles that have any.  Only tiles with
+    something on them have an entry, and reading a tile never makes one, so memory follows the number of
+    objects rather than the number of tiles ever looked at.  A tile with a single object (the usual case)
+    holds it as it is; a list is only made once a second object is stacked on top.
+    Dicts don't shrink when entries are deleted, so after many removals the dict is rebuilt (compact()).
+    """
+    def __init__(self):
+        self._stacks = {} # tile -> the object on it, or a list of objects (bottom first) if there are several
+        self._removals = 0 # entries deleted since the dict was last rebuilt
+    def __len__(self):
+        return len(self._stacks) # the number of tiles with something on them
+    def __contains__(self,tile):
+        return tile in self._stacks # is anything on the tile?
+    def __iter__(self):
+        return iter(self._stacks)
+    def stack(self,tile):
+        # tuple of the objects on a tile, bottom first (empty if there are none)
+        entry = self._stacks.get(tile)
+        if entry is None: return ()
+        if type(entry) is list: return tuple(entry)
+        return (entry,)
+    def top(self,tile):
+        # the object on top of a tile's stack, or None
+        entry = self._stacks.get(tile)
+        if type(entry) is list: return entry[-1]
+        return entry
+    def push(self,tile,obj):
+        entry = self._stacks.get(tile)
+        if entry is None: self._stacks[tile] = obj
+        elif type(entry) is list: entry.append(obj)
+        else: self._stacks[tile] = [entry,obj]
+    def remove(self,tile,obj):
+        # take one copy of obj off a tile (raises ValueError if it isn't there, like list.remove)
+        entry = self._stacks.get(tile)
+        if type(entry) is list:
+            entry.remove(obj)
+            if len(entry) == 1: self._stacks[tile] = entry[0]
+            return
+        if entry is None or entry != obj: raise ValueError("object not on tile %d" % tile)
+        del self._stacks[tile]
+        self._removals += 1
+        if self._removals > max(1024,4*len(self._stacks)): self.compact()
+    def compact(self):
+        self._stacks = dict(self._stacks)
+        self._removals = 0
+
+        
 class Level:
     """
     Represents a single 2D map/level in the game.
@@ -93,50 +317,168 @@ class Level:
     
     def __init__(self,geom,default_terrain):
         self._geom = geom
-        self._terrains = [default_terrain for t in range(self._geom.tilecount())] # list containing one Terrain object for each tile
-        self._things_at = defaultdict(list) # dictionary of lists(stacks) of inanimate objects indexed by tile#
-        self._critters_at = defaultdict(list) # dictionary of lists(stacks) of critters indexed by tile#
+        self._terrain_types = TerrainRegistry() # the terrain types used on this level, numbered
+        self._terrains = self._geom.tile_store(self._terrain_types.id_of(default_terrain),"B") # the terrain type id of each tile
+        self._things_at = TileStacks() # stacks of inanimate objects indexed by tile#
+        self._critters_at = TileStacks() # stacks of critters indexed by tile#
+        self._things_index = spatial.SpatialHash(geom) # the same things and critters, bucketed by area for "what's near here?" queries
+        self._critters_index = spatial.SpatialHash(geom)
+        self._terrain_listeners = [] # callbacks to be told about every place_terrain(), separately from the viewport's change queue
+        self._path_cache = pathfinding.PathCache(self) # recently found walking paths
+        # which tiles can reach each other on foot (not on chunked maps, where labelling would flood the whole world)
+        self._regions = None if isinstance(geom,geometry.ChunkedRectangle8) else regions.RegionMap(self)
         self.refresh()  # This function flags all terrains, etc as "changed" so the viewport will "clear its cache" and re-draw all tiles.
 
         
     def refresh(self):
         # These "change queues" inform any outside observer (i.e. the graphics Viewport)
         # which tiles have been updated since it last checked. The observer should pop() 
-        # them as it processes them.
-        self.terrain_changes = set(range(self._geom.tilecount()))
-        self.thing_changes = set(self._things_at)
-        self.critter_changes = set(self._critters_at)
+        # them as it processes them.  They come from geometry.tile_set() (bitmaps that behave like sets of tile #s).
+        self.terrain_changes = self._geom.tile_set(full=True)
+        self.thing_changes = self._geom.tile_set(self._things_at)
+        self.critter_changes = self._geom.tile_set(self._critters_at)
     def geometry(self):
         return self._geom
     def terrain(self,tile):
-        return self._terrains[tile]
+        return self._terrain_types.terrain(self._terrains[tile])
+    def terrain_ids(self):
+        # the terrain type id of every tile, as an array('B') (or a chunks.ChunkedStore on a chunked map);
+        # look the ids up with terrain_types().terrain(id).  A flat array can be saved with .tobytes().
+        return self._terrains
+    def terrain_types(self):
+        return self._terrain_types
+    def flags(self,tile):
+        # the tile's terrain flags: IMPASSABLE, OPAQUE and BUILT bits (looked up by its terrain type)
+        return self._terrain_types.flag_table[self._terrains[tile]]
+    def passable(self,tile):
+        return not self._terrain_types.flag_table[self._terrains[tile]] & IMPASSABLE
+    def is_built(self,tile):
+        return self._terrain_types.flag_table[self._terrains[tile]] & BUILT != 0
+    def transparency(self):
+        # the see-through flag (1 = transparent, 0 = opaque) of every tile, for line-of-sight calculations.
+        # Hot loops can skip the view: terrain_types().transparent_table[terrain_ids()[tile]] is the same thing.
+        return TerrainLookup(self._terrains,self._terrain_types.transparent_table)
+    def add_terrain_listener(self,callback):
+        # callback(tile) will be called whenever place_terrain() changes a tile
+        self._terrain_listeners.append(callback)
+    def remove_terrain_listener(self,callback):
+        self._terrain_listeners.remove(callback)
+    def move_cost(self,tile):
+        # cost callback for the geometry's pathfinding: the multiplier for entering a tile, or None if it's impassable
+        if self._terrain_types.flag_table[self._terrains[tile]] & IMPASSABLE: return None
+        else: return 1
+    move_cost.uniform = True # every passable tile costs the same, so the geometry may use a faster search
+    def path_from_to(self,origin,destination):
+        # return the list of tile #s on the shortest walkable path between two tiles (both included), or None
+        if self._regions and self._regions.region(origin) is not None and not self._regions.same_region(origin,destination):
+            return None # no path can exist, so don't look for one
+        return self._path_cache.path_from_to(origin,destination,self.move_cost,profile="walk")
+    def path_job(self,origin,destination,expansions=200):
+        # the same walking path as path_from_to(), but as a resumable pathfinding.path_job for a jobs.JobScheduler
+        if self._regions and self._regions.region(origin) is not None and not self._regions.same_region(origin,destination):
+            return pathfinding.no_path_job()
+        return pathfinding.path_job(self._geom,origin,destination,self.move_cost,expansions)
+    def same_region(self,a,b):
+        # can tile a be reached from tile b on foot? (None if the Level doesn't keep track)
+        if self._regions is None: return None
+        return self._regions.same_region(a,b)
+    def path_cache(self):
+        return self._path_cache
+    def page_out_far(self,tile,radius):
+        # on a chunked geometry, page out the terrain of every chunk more than radius chunks from the tile
+        # (GameData.move_player calls this after every step the player takes)
+        if hasattr(self._terrains,"page_out_far"): self._terrains.page_out_far(tile,radius)
+    def things_near(self,tile,radius,tag=None,accept=None):
+        # list of (tile,thing) for the things within radius of a tile (optionally only those with a tag,
+        # or for which accept(thing) is true), nearest first
+        return self._things_index.within(tile,radius,tag,accept)
+    def nearest_things(self,tile,k=1,tag=None,max_radius=None,accept=None):
+        # list of (tile,thing) for the k things nearest to a tile (filtered as in things_near()), nearest first
+        return self._things_index.nearest(tile,k,tag,max_radius,accept)
+    def critters_near(self,tile,radius,tag=None,accept=None):
+        return self._critters_index.within(tile,radius,tag,accept)
+    def nearest_critters(self,tile,k=1,tag=None,max_radius=None,accept=None):
+        return self._critters_index.nearest(tile,k,tag,max_radius,accept)
     def top_thing_at(self,tile):
-        if len(self._things_at[tile]): return self._things_at[tile][-1]
-        else: return None # if item stack for tile is empty
+        return self._things_at.top(tile) # None if item stack for tile is empty
     def top_critter_at(self,tile):
-        if len(self._critters_at[tile]): return self._critters_at[tile][-1]
-        else: return None # if item stack for tile is empty
+        return self._critters_at.top(tile)
+    def things_at(self,tile):
+        # tuple of the things on a tile, bottom of the stack first
+        return self._things_at.stack(tile)
+    def critters_at(self,tile):
+        return self._critters_at.stack(tile)
+    def compact(self):
+        # shrink the thing/critter stacks after a lot of things have come and gone (done now and then anyway)
+        self._things_at.compact()
+        self._critters_at.compact()
     def place_terrain(self,terrain,tile): # replace the default terrain with a new terrain type at a particular tile
-        self._terrains[tile] = terrain
+        self._terrains[tile] = self._terrain_types.id_of(terrain)
         self.terrain_changes.add(tile) # signal a change
+        for callback in self._terrain_listeners: callback(tile)
     def place_thing(self,thing,tile): # put a thing into a place on the level (doesn't actually create it)
-        self._things_at[tile].append(thing) # "stack" a thing
+        self._things_at.push(tile,thing) # "stack" a thing
+        self._things_index.insert(thing,tile)
         self.thing_changes.add(tile) # signal a change
     def place_critter(self,critter,tile): # put a critter into a place on the level (doesn't actually create it)
-        self._critters_at[tile].append(critter) # "stack" a critter
+        self._critters_at.push(tile,critter) # "stack" a critter
+        self._critters_index.insert(critter,tile)
         self.critter_changes.add(tile) # signal a change
+    def remove_thing(self,thing,tile): # take a thing off a tile (doesn't destroy it)
+        self._things_at.remove(tile,thing)
+        self._things_index.remove(thing,tile)
+        self.thing_changes.add(tile) # signal a change
     def remove_critter(self,critter,tile): # remove the critter from its current tile
-        self._critters_at[tile].remove(critter)
+        self._critters_at.remove(tile,critter)
+        self._critters_index.remove(critter,tile)
         self.critter_changes.add(tile) # signal a change
         
         
+def _tag_names(obj):
+    # the tag names of a thing or critter (its _tags may be a list, or an info file's tag field)
+    tags = getattr(obj,"_tags",())
+    return parse_tags(tags) if isinstance(tags,str) else tags
+
+def _index_tags(indexes,obj,obj_id):
+    for tag in _tag_names(obj): indexes.setdefault(tag,set()).add(obj_id)
+
+def _unindex_tags(indexes,obj,obj_id):
+    for tag in _tag_names(obj):
+        ids = indexes.get(tag)
+        if ids is None: continue
+        ids.discard(obj_id)
+        if not ids: del indexes[tag]
+
+def _tagged(indexes,tags):
+    # the ids in all of the tag sets, intersected smallest first
+    sets = sorted( (indexes.get(tag,set()) for tag in tags), key=len )
+    if not sets: return set()
+    result = set(sets[0])
+    for ids in sets[1:]:
+        if not result: break
+        result &= ids
+    return result
+
+def image_for(image_id):
+    # the graphics for an image id.  Everything in this module refers to images only by id, so it can be used
+    # without a display; tiles (pyglet, the tileset and all the colourised images) is imported on the first
+    # call, which in the game is when the Viewport starts drawing.
+    import tiles
+    return tiles.tiles[image_id]
+
+def see_through(terrain):
+    # 1 if the terrain can be seen through, 0 if it blocks line of sight
+    if tag_mask(terrain) & OPAQUE: return 0
+    else: return 1
+
         
 class Player:
     # the '@' player character
     def __init__(self,tilenum):
         self._location = tilenum
+    image_id = "adventurer"
     def image(self):
-        return tiles.tiles["adventurer"]
+        return image_for(self.image_id)
     def name(self):
         return "our hero"
        
@@ -144,48 +486,55 @@ class Player:
 class Grass:
     # an example of a terraintype (in the real game the types should be loaded from a text file and made into objects at runtime)
     _tags = []
+    _mask = TAGS.mask(_tags)
+    image_id = "grassland"
     def image(self):
-        return tiles.tiles["grassland"]
+        return image_for(self.image_id)
     def name(self):
         return "a patch of grass"
 
         
 class Wall:
-    _tags = ["impassable"]
+    _tags = ["impassable","opaque"]
+    _mask = TAGS.mask(_tags)
+    image_id = "brickwall"
     def image(self):
-        return tiles.tiles["brickwall"]
+        return image_for(self.image_id)
     def name(self):
         return "a stone wall"
 
 
 class Shrubbery:
     # an example of a thing (in the real game the types should be loaded from a text file and made into objects at runtime)
+    image_id = "shrubbery"
     def image(self):
-        return tiles.tiles["shrubbery"]
+        return image_for(self.image_id)
     def name(self):
         return "a shrubbery"
 
 class PlantType:
-    # a type of plant: contains the tile/image as well as the plant type's properties
-    def __init__(self,name,tile,tags):
+    # a type of plant: contains the id of its tile/image (a key of tiles.tiles) as well as the plant type's properties
+    def __init__(self,name,image_id,tags):
         self._name = name
-        self._tile = tile
-        self._tags = tags
+        self.image_id = image_id
+        self._tags = parse_tags(tags) if isinstance(tags,str) else list(tags) # tags may be given as an info file's tag field
+        self._mask = TAGS.mask(self._tags)
     def name(self):
         return self._name
     def image(self):
-        return self._tile
+        return image_for(self.image_id)
 
 class TerrainType:
-    # a type of terrain: contains the tile/image as well as the terrain type's properties
-    def __init__(self,name,tile,tags):
+    # a type of terrain: contains the id of its tile/image (a key of tiles.tiles) as well as the terrain type's properties
+    def __init__(self,name,image_id,tags):
         self._name = name
-        self._tile = tile
-        self._tags = tags
+        self.image_id = image_id
+        self._tags = parse_tags(tags) if isinstance(tags,str) else list(tags)
+        self._mask = TAGS.mask(self._tags)
     def name(self):
         return self._name
     def image(self):
-        return self._tile
+        return image_for(self.image_id)
 
 
         
@@ -193,4 +542,4 @@ class TerrainType:
 if __name__ == "__main__":
     "UNIT TEST CODE"
     gd = GameData()
-    print( gd._level._terrains )
\ No newline at end of file
+    print( gd._level.terrain_ids() )
\ No newline at end of file
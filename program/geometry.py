@@ -1,5 +1,8 @@
 "map geometries"
-  
+import heapq, math, re
+from array import array
+from collections.abc import Sequence, Mapping
+from functools import lru_cache
 
 
 
@@ -20,6 +23,8 @@ class AbstractGeometry:
     SW = 5
     SOUTH = 6
     SE = 7
+    UP = 8 # to the layer above, in geometries that have layers
+    DOWN = 9
     
     def __init__(self,*dimensions):
         # determine the number of map tiles given the desired dimensions (in tiles)
@@ -29,6 +34,14 @@ class AbstractGeometry:
         # return the number of tiles
         return self.num_tiles
         pass
+    def tile_store(self,default,typecode=None):
+        # return a new mutable sequence holding one entry per tile, all set to default
+        # (an array of the given typecode if there is one, otherwise a list)
+        if typecode is None: return [default]*self.num_tiles
+        else: return array(typecode,[default])*self.num_tiles
+    def tile_set(self,tiles=(),full=False):
+        # return a new set of tile #s (a TileSet bitmap), holding the given tiles or, if full, every tile
+        return TileSet(self.num_tiles,tiles,full)
     def randomtile(self):
         # pick a tile at random
         import random
@@ -46,16 +59,95 @@ class AbstractGeometry:
     def adjacent(self,origin,direction):
         # returns the tile # adjacent to the current one in the specified direction, or None.
         # (None means either the direction is invalid in this geometry, or the adjacent tile is off the map)
+        if not direction in self.valid_directions: return None
+        n = self.neighbor_tables[direction][origin]
+        if n < 0: return None # if the move is off the map
+        else: return n
+    def neighbors(self,tile):
+        # return a list of all the tile #s adjacent to a tile (in direction order, leaving out any that are off the map)
+        if self._neighbor_tables is None: self._build_neighbor_tables()
+        return [ n for n in [table[tile] for table in self._neighbor_list] if n >= 0 ]
+    def adjacent_many(self,tiles,direction):
+        # return an array('l') of the tiles adjacent to each of a sequence of tiles in one direction (-1 where that's off the map)
+        if not direction in self.valid_directions: return array('l',[-1])*len(tiles)
+        table = self.neighbor_tables[direction]
+        return array('l',[ table[t] for t in tiles ])
+    def distance_many(self,origin,tiles):
+        # return an array('d') of the distances from the origin to each of a sequence of tiles
+        return array('d',[ self.distance(origin,t) for t in tiles ])
+    def rectangle_mask(self,origin,height,width):
+        # return a tile_set() of the tiles in a block of rows and columns with its bottom left corner at origin
+        # (clipped at the edges of the map).  Each row of the block is a run of consecutive tile #s,
+        # so the set is filled a row at a time rather than a tile at a time.
+        mask = self.tile_set()
+        r0, c0 = self.row(origin), self.col(origin)
+        base = origin - self._row_start(r0) - c0 # 0, unless the geometry has layers and the origin isn't on the first
+        for r in range( max(r0,0), min(r0+height,self._rows) ):
+            first, last = max(c0,0), min(c0+width,self._row_length(r))
+            if first < last: mask.update( range(base+self._row_start(r)+first,base+self._row_start(r)+last) )
+        return mask
+    def tiles_in_mask(self,mask):
+        # return an array('l') of the tiles in a mask (e.g. from rectangle_mask()), in tile # order
+        return array('l',sorted(mask))
+    _neighbor_tables = None
+    @property
+    def neighbor_tables(self):
+        # the tables are only built the first time something needs them, so creating a geometry stays cheap
+        if self._neighbor_tables is None: self._build_neighbor_tables()
+        return self._neighbor_tables
+    def _build_neighbor_tables(self):
+        # precompute the adjacent tile in every valid direction for every tile: one array('i') per direction,
+        # holding -1 wherever the step would go off the map, so that moves become a single array lookup.
+        # The tables are filled a row at a time: a step of (dr,dc) from column c of row r lands on tile
+        # _row_start(r+dr)+c+dc, as long as that row exists and has that column.
+        self._neighbor_tables = {}
+        for d in sorted(self.valid_directions):
+            table = array('i')
+            for r in range(self._rows):
+                length = self._row_length(r)
+                dr,dc = self._row_adj(r)[d]
+                if not (0 <= r+dr < self._rows):
+                    table.extend( array('i',[-1])*length ) # the whole row steps off the top or bottom
+                    continue
+                first = min( length, max(0,-dc) ) # the range of columns from which this step stays on the map
+                last = max( first, min(length, self._row_length(r+dr)-dc) )
+                start = self._row_start(r+dr) + dc
+                table.extend( array('i',[-1])*first )
+                table.extend( range(start+first,start+last) )
+                table.extend( array('i',[-1])*(length-last) )
+            self._neighbor_tables[d] = table
+        self._neighbor_list = [ self._neighbor_tables[d] for d in sorted(self._neighbor_tables) ]
+    def distance(self,origin,destination):
+        # return the length of the shortest unobstructed route between two tiles (in dir_distance units)
         pass
     def nearest_tiles(self,origin,n):
-        # return an ordered list of the n nearest tile #s from the origin
-        pass
+        # generate the n nearest tile #s from the origin (starting with the origin itself), in order of distance.
+        # The offsets are made ring by ring as they're needed, so a caller that stops at the first hit never pays
+        # for the whole map, and the search never reaches past the farthest tile from the origin.
+        found = 0
+        for dist,t in self._within(origin,int(math.ceil(self.max_distance(origin)))):
+            yield t
+            found += 1
+            if found >= n: return
+    def max_distance(self,origin):
+        # the distance from the origin to the farthest tile on the map (at least as far as any tile on the edge)
+        rows, cols = self.rows(), self.cols()
+        edge = [ (r,c) for r in (0,rows-1) for c in range(cols) ] + [ (r,c) for r in range(rows) for c in (0,cols-1) ]
+        return max( self.distance(origin,self.tile_at_coords(r,c)) for r,c in edge )
     def tiles_within(self,origin,n):
-        # return an ordered list (from nearest to farthest) of all tiles up to n steps from the origin
-        pass        
-    def path_from_to(self,origin,destination):
-        # return a list of tile #s on the shortest path from origin to destination
+        # generate all tiles up to n steps from the origin, from nearest to farthest (clipped at the map edges)
+        for dist,t in self._within(origin,n):
+            yield t
+    def _within(self,origin,n):
+        # generate (distance,tile) for all tiles up to n steps from the origin, sorted by distance;
+        # subclasses do this by laying a cached, pre-sorted template of offsets over the origin
         pass
+    def path_from_to(self,origin,destination,cost=None):
+        # return a list of tile #s on the shortest path from origin to destination (both included), or None if there is none.
+        # cost is an optional callback, cost(tile), returning the multiplier (1 or more) for entering a tile or None if it's impassable
+        import pathfinding
+        if not hasattr(self,"_pathfinder"): self._pathfinder = pathfinding.AStar(self) # search tables are allocated on first use
+        return self._pathfinder.search(origin,destination,cost)
 
 
 
@@ -74,75 +166,318 @@ class Rectangle8(AbstractGeometry):
         self._rows = rows
         # determine the number of map tiles given the desired width/height (in tiles)
         self.num_tiles = (cols*rows)
-        # set up internal tile-to-coordinate system
-        self.tile_to_coords = []
-        for r in range(rows):
-            for c in range(cols):
-                self.tile_to_coords.append((r,c))
-        # set up coordinate-to-tile lookup dictionary (reverse of above)
-        self.coords_to_tile = dict( zip(self.tile_to_coords,range(self.num_tiles)) )
+        # tile numbers run along each row from the bottom: tile = row*cols + col, so coordinates are
+        # worked out with arithmetic rather than stored. tile_to_coords/coords_to_tile are kept only as
+        # read-only views that compute their entries on demand, for code that still wants the old tables.
+        self.tile_to_coords = TileToCoordsView(self)
+        self.coords_to_tile = CoordsToTileView(self)
         # define valid directions for this geometry
         self.valid_directions = { self.EAST:1, self.NE:1.4, self.NORTH:1, self.NW:1.4, self.WEST:1, self.SW:1.4, self.SOUTH:1, self.SE:1.4 }
         # coordinate adjustments for a "step" in each direction
         self.adj = { self.EAST: (0,1), self.NE: (1,1), self.NORTH: (1,0), self.NW: (1,-1), self.WEST: (0,-1), self.SW: (-1,-1), self.SOUTH: (-1,0), self.SE: (-1,1) } 
+    def _coords(self,tile):
+        # (row,col) of a tile
+        return divmod(tile,self._cols)
+    def _tile(self,row,col):
+        # tile # at (row,col), or None if that's off the map
+        if 0 <= row < self._rows and 0 <= col < self._cols: return row*self._cols + col
+        else: return None
+    def _row_start(self,r):
+        # the tile # of the first tile in row r
+        return r*self._cols
+    def _row_length(self,r):
+        return self._cols
+    def _row_adj(self,r):
+        # coordinate adjustments for a step in each direction from row r
+        return self.adj
     def viewport(self,corner_row,corner_col,display_rows,display_cols):
-        visible_tiles = set()
+        # the visible tiles as a set of tile #s; view_rect() gives the same tiles without building the set
+        rect = self.view_rect(corner_row,corner_col,display_rows,display_cols)
+        if rect is None: return None
+        return set(rect)
+    def view_rect(self,corner_row,corner_col,display_rows,display_cols):
+        # the visible tiles as a TileRect, or None if the view runs off the map
         if (display_rows == 0): display_rows = self._rows - corner_row # in this case we assume they want all of them to the top
         if (display_cols == 0): display_cols = self._cols - corner_col # in this case we assume they want all of them to the end
-        try:
-            for r in range(corner_row,corner_row+display_rows):
-                for c in range(corner_col,corner_col+display_cols):
-                    visible_tiles.add( self.coords_to_tile[(r,c)] )
-            return visible_tiles
-        except KeyError:
-            # viewport is out of bounds
-            return None
+        if display_rows > 0 and display_cols > 0:
+            if corner_row < 0 or corner_col < 0 or corner_row+display_rows > self._rows or corner_col+display_cols > self._cols:
+                return None # viewport is out of bounds
+        return TileRect(self._cols,corner_row,corner_col,display_rows,display_cols)
     def raw_xy(self,tile,tilewidth,tileheight):
         # return the x,y offset from the abstract map origin for a given tile for a given tile size
         # (not necessarily where it will appear on screen -- another object will adjust the "viewport")
-        r,c = self.tile_to_coords[tile]
+        r,c = divmod(tile,self._cols)
         return (c*tilewidth),(r*tileheight)   
     def dir_distance(self,direction):
         # return the distance of a "step" in this direction (e.g. using pythagorean theorem or other math)
         if not direction in self.valid_directions: return None
         else: return self.valid_directions[direction]
-    def adjacent(self,origin,direction):
-        # returns the tile # adjacent to the current one in the specified direction, or None.
-        # (None means either the direction is invalid in this geometry, or the adjacent tile is off the map)
-        if not direction in self.valid_directions: return None
+    def distance(self,origin,destination):
+        # "octile" distance: as many diagonal steps as possible, then straight steps for the rest
+        r1,c1 = divmod(origin,self._cols)
+        r2,c2 = divmod(destination,self._cols)
+        dr,dc = abs(r1-r2),abs(c1-c2)
+        return max(dr,dc) + (self.valid_directions[self.NE]-1)*min(dr,dc)
+    def distance_many(self,origin,tiles):
+        # return an array('d') of the octile distances from the origin to each of a sequence of tiles
+        r1,c1 = divmod(origin,self._cols)
+        cols, extra = self._cols, self.valid_directions[self.NE]-1
+        out = array('d')
+        for t in tiles:
+            r2,c2 = divmod(t,cols)
+            dr,dc = abs(r1-r2),abs(c1-c2)
+            out.append( dr + extra*dc if dr > dc else dc + extra*dr )
+        return out
+    def max_distance(self,origin):
+        # distance only grows away from the origin, so the farthest tile is one of the corners
+        r,c = divmod(origin,self._cols)
+        dr,dc = max(r,self._rows-1-r), max(c,self._cols-1-c)
+        return max(dr,dc) + (self.valid_directions[self.NE]-1)*min(dr,dc)
+    def _within(self,origin,n):
+        r,c = divmod(origin,self._cols)
+        cols = self._cols
+        for dist,dr,dc in square_offsets(n,self.valid_directions[self.NE],(-r,self._rows-1-r,-c,cols-1-c)):
+            yield dist, (r+dr)*cols + c+dc
+    def path_from_to(self,origin,destination,cost=None):
+        # when every passable tile costs the same (no cost callback, or one marked with .uniform = True)
+        # jump point search finds an equally short path while expanding far fewer tiles than plain A*
+        if cost is None or getattr(cost,"uniform",False):
+            import pathfinding
+            if not hasattr(self,"_jumpfinder"): self._jumpfinder = pathfinding.JumpPointSearch(self)
+            return self._jumpfinder.search(origin,destination,cost)
         else:
-            origin_coords = self.tile_to_coords[origin]
-            # add the origin_coords and the adj. to get the move-to coordinates
-            move_to_coords = tuple(sum(q) for q in zip(origin_coords,self.adj[direction]))
-            if move_to_coords in self.coords_to_tile: return self.coords_to_tile[move_to_coords]
-            else: return None # if the move is off the map
+            return AbstractGeometry.path_from_to(self,origin,destination,cost)
     def rows(self):
         return self._rows
     def cols(self):
         return self._cols
     def row(self,tile):
         # return the row of a given tile
-        return self.tile_to_coords[tile][0]
+        return tile // self._cols
     def col(self,tile):
         # return the column of a given tile
-        return self.tile_to_coords[tile][1]
+        return tile % self._cols
     def tile_at_coords(self, row, col):
-        if (row,col) in self.coords_to_tile:
-            return self.coords_to_tile[ (row,col) ]
+        if 0 <= row < self._rows and 0 <= col < self._cols:
+            return row*self._cols + col
         else:
             return False
     def rectangle(self,origin,height,width):
-        # return the set of tiles in a rectangle starting at a particular corner
-        tiles = []
-        for i in range(height):
-            for j in range(width):
-                t = (self.tile_at_coords(self.row(origin)+i,self.col(origin)+j))
-                if t: tiles.append(t)
-        return tiles
+        # return the list of tiles in a rectangle starting at a particular corner
+        return list( self.tiles_in_mask( self.rectangle_mask(origin,height,width) ) )
+
+
+
+
+class ChunkedRectangle8(Rectangle8):
+    """
+    A Rectangle8 for very large maps.  Tiles are numbered exactly as in Rectangle8 (tile = row*cols + col),
+    but the map is also cut into square chunks of chunk_size x chunk_size tiles, and the per-tile storage
+    from tile_store() is a chunks.ChunkedStore that only allocates a chunk when one of its tiles is written
+    and can page chunks out to disk (tile_set() likewise gives a chunks.ChunkedTileSet).  Neighbors are worked out arithmetically instead of from tables,
+    so nothing here grows with the size of the map.
+    """
+    def __init__(self,cols,rows,chunk_size=64):
+        Rectangle8.__init__(self,cols,rows)
+        self._chunk_size = chunk_size
+    def chunk_size(self):
+        return self._chunk_size
+    def chunk_of(self,tile):
+        # the key of the chunk holding a tile: (chunk row, chunk col)
+        r,c = divmod(tile,self._cols)
+        return r // self._chunk_size, c // self._chunk_size
+    def chunk_index(self,tile):
+        # (chunk key, position of the tile within that chunk's storage)
+        r,c = divmod(tile,self._cols)
+        kr,rr = divmod(r,self._chunk_size)
+        kc,cc = divmod(c,self._chunk_size)
+        return (kr,kc), rr*self._chunk_size + cc
+    def chunk_rect(self,key):
+        # the tiles of a chunk as a TileRect (chunks along the top and right edges may be cut short)
+        r, c = key[0]*self._chunk_size, key[1]*self._chunk_size
+        return TileRect(self._cols,r,c,min(self._chunk_size,self._rows-r),min(self._chunk_size,self._cols-c))
+    def tile_store(self,default,typecode=None):
+        import chunks
+        return chunks.ChunkedStore(self,default,typecode)
+    def tile_set(self,tiles=(),full=False):
+        import chunks
+        return chunks.ChunkedTileSet(self,tiles,full)
+    def _build_neighbor_tables(self):
+        # same interface as the precomputed tables, but each lookup is worked out when it's made
+        self._neighbor_tables = { d: StepView(self,dr,dc) for d,(dr,dc) in sorted(self.adj.items()) }
+        self._neighbor_list = [ self._neighbor_tables[d] for d in sorted(self._neighbor_tables) ]
+    def path_from_to(self,origin,destination,cost=None):
+        # always plain A*: it only reads the tiles it expands, where a search that scans ahead along rows or
+        # diagonals (such as jump point search) would page in chunks all the way to the edge of the world
+        return AbstractGeometry.path_from_to(self,origin,destination,cost)
+
+
+
+
+class Torus8(Rectangle8):
+    """
+    A Rectangle8 that wraps around: stepping off the east edge comes back on at the west edge, and
+    stepping off the top comes back at the bottom, so every tile has all eight neighbors.
+    Tile numbering, coordinates, raw_xy and the viewport are the same as in Rectangle8 (a view still
+    shows the map from tile 0, without wrapping); distances take the short way around.
+    """
+    def _build_neighbor_tables(self):
+        self._neighbor_tables = {}
+        rows, cols = self._rows, self._cols
+        for d in sorted(self.valid_directions):
+            dr,dc = self.adj[d]
+            shifted = array( 'i', [ (c+dc) % cols for c in range(cols) ] ) # the column a step lands in, from each column
+            table = array('i')
+            for r in range(rows):
+                base = ((r+dr) % rows) * cols
+                table.extend( base + c for c in shifted )
+            self._neighbor_tables[d] = table
+        self._neighbor_list = [ self._neighbor_tables[d] for d in sorted(self._neighbor_tables) ]
+    def _wrapped_deltas(self,origin,destination):
+        r1,c1 = divmod(origin,self._cols)
+        r2,c2 = divmod(destination,self._cols)
+        dr,dc = abs(r1-r2),abs(c1-c2)
+        return min(dr,self._rows-dr), min(dc,self._cols-dc)
+    def distance(self,origin,destination):
+        # octile distance, going around whichever way is shorter
+        dr,dc = self._wrapped_deltas(origin,destination)
+        return max(dr,dc) + (self.valid_directions[self.NE]-1)*min(dr,dc)
+    def distance_many(self,origin,tiles):
+        return AbstractGeometry.distance_many(self,origin,tiles)
+    def max_distance(self,origin):
+        # the same from every tile: halfway round the map both ways
+        dr,dc = self._rows//2, self._cols//2
+        return max(dr,dc) + (self.valid_directions[self.NE]-1)*min(dr,dc)
+    def _within(self,origin,n):
+        r,c = divmod(origin,self._cols)
+        rows,cols = self._rows,self._cols
+        wraps = 2*n+1 > rows or 2*n+1 > cols # the template is bigger than the map, so it would meet itself
+        seen = set()
+        for dist,dr,dc in square_offsets(n,self.valid_directions[self.NE]):
+            t = ((r+dr) % rows)*cols + (c+dc) % cols
+            if wraps:
+                if t in seen: continue
+                seen.add(t)
+            yield dist, t
+    def path_from_to(self,origin,destination,cost=None):
+        # jump point search doesn't know about the wrap-around, so always use plain A*
+        return AbstractGeometry.path_from_to(self,origin,destination,cost)
+
+
+
+
+class Stacked3D(AbstractGeometry):
+    """
+    Several rectangular layers of the same size stacked on top of each other (e.g. the floors of a building),
+    with a single tile numbering: tile = (layer*rows + row)*cols + col.  Within a layer moves are the same
+    eight as in Rectangle8, and UP/DOWN steps go to the same row and column on the next layer.  The neighbor
+    tables only describe the shape of the map; whether a creature can actually climb (only at stairs, say)
+    is up to the cost callback.  row() and col() are within the tile's layer, and layer() gives the layer.
+    """
+    def __init__(self,cols,rows,layers,vertical_cost=1):
+        self._cols = cols
+        self._rows = rows
+        self._layers = layers
+        self.num_tiles = cols*rows*layers
+        self.valid_directions = { self.EAST:1, self.NE:1.4, self.NORTH:1, self.NW:1.4, self.WEST:1, self.SW:1.4, self.SOUTH:1, self.SE:1.4,
+                                  self.UP:vertical_cost, self.DOWN:vertical_cost }
+        # (drow,dcol,dlayer) for a step in each direction
+        self.adj = { self.EAST: (0,1,0), self.NE: (1,1,0), self.NORTH: (1,0,0), self.NW: (1,-1,0), self.WEST: (0,-1,0), self.SW: (-1,-1,0),
+                     self.SOUTH: (-1,0,0), self.SE: (-1,1,0), self.UP: (0,0,1), self.DOWN: (0,0,-1) }
+    def _coords(self,tile):
+        # (row,col) of a tile within its layer
+        return divmod(tile % (self._rows*self._cols),self._cols)
+    def _tile(self,row,col,layer=0):
+        if 0 <= row < self._rows and 0 <= col < self._cols and 0 <= layer < self._layers: return (layer*self._rows + row)*self._cols + col
+        else: return None
+    def _row_start(self,r):
+        # the tile # of the first tile in row r of the bottom layer
+        return r*self._cols
+    def _row_length(self,r):
+        return self._cols
+    def rows(self):
+        return self._rows
+    def cols(self):
+        return self._cols
+    def layers(self):
+        return self._layers
+    def row(self,tile):
+        return (tile // self._cols) % self._rows
+    def col(self,tile):
+        return tile % self._cols
+    def layer(self,tile):
+        return tile // (self._rows*self._cols)
+    def tile_at_coords(self,row,col,layer=0):
+        t = self._tile(row,col,layer)
+        if t is None: return False
+        else: return t
+    def viewport(self,corner_row,corner_col,display_rows,display_cols,layer=0):
+        rect = self.view_rect(corner_row,corner_col,display_rows,display_cols,layer)
+        if rect is None: return None
+        return set(rect)
+    def view_rect(self,corner_row,corner_col,display_rows,display_cols,layer=0):
+        # the visible tiles of one layer as a TileRect (each layer's rows follow on from the layer below's)
+        if (display_rows == 0): display_rows = self._rows - corner_row
+        if (display_cols == 0): display_cols = self._cols - corner_col
+        if display_rows > 0 and display_cols > 0:
+            if corner_row < 0 or corner_col < 0 or corner_row+display_rows > self._rows or corner_col+display_cols > self._cols:
+                return None # viewport is out of bounds
+        return TileRect(self._cols,layer*self._rows + corner_row,corner_col,display_rows,display_cols)
+    def raw_xy(self,tile,tilewidth,tileheight):
+        # layers are drawn in the same place: a view shows one layer at a time
+        r,c = self._coords(tile)
+        return (c*tilewidth),(r*tileheight)
+    def dir_distance(self,direction):
+        if not direction in self.valid_directions: return None
+        else: return self.valid_directions[direction]
+    def _build_neighbor_tables(self):
+        self._neighbor_tables = {}
+        rows, cols, layers = self._rows, self._cols, self._layers
+        for d in sorted(self.valid_directions):
+            dr,dc,dz = self.adj[d]
+            first, last = max(0,-dc), min(cols,cols-dc) # the columns from which the step stays on the map
+            table = array('i')
+            for z in range(layers):
+                for r in range(rows):
+                    if not (0 <= z+dz < layers and 0 <= r+dr < rows):
+                        table.extend( array('i',[-1])*cols )
+                        continue
+                    start = ((z+dz)*rows + r+dr)*cols + dc
+                    table.extend( array('i',[-1])*first )
+                    table.extend( range(start+first,start+last) )
+                    table.extend( array('i',[-1])*(cols-last) )
+            self._neighbor_tables[d] = table
+        self._neighbor_list = [ self._neighbor_tables[d] for d in sorted(self._neighbor_tables) ]
+    def distance(self,origin,destination):
+        # octile distance within the layers, plus the climb between them
+        r1,c1 = self._coords(origin)
+        r2,c2 = self._coords(destination)
+        dr,dc = abs(r1-r2),abs(c1-c2)
+        dz = abs(self.layer(origin)-self.layer(destination))
+        return max(dr,dc) + (self.valid_directions[self.NE]-1)*min(dr,dc) + dz*self.valid_directions[self.UP]
+    def max_distance(self,origin):
+        # the farthest corner of the farthest layer, counting the climb
+        r,c = self._coords(origin)
+        z = self.layer(origin)
+        dr,dc,dz = max(r,self._rows-1-r), max(c,self._cols-1-c), max(z,self._layers-1-z)
+        return max(dr,dc) + (self.valid_directions[self.NE]-1)*min(dr,dc) + dz*self.valid_directions[self.UP]
+    def _within(self,origin,n):
+        # the square template on every layer close enough to reach, merged in order of distance
+        r,c = self._coords(origin)
+        z = self.layer(origin)
+        climb = self.valid_directions[self.UP]
+        def layer_tiles(zz):
+            dz = abs(zz-z)
+            base = zz*self._rows*self._cols
+            bounds = (-r,self._rows-1-r,-c,self._cols-1-c)
+            for dist,dr,dc in square_offsets(int(n - dz*climb),self.valid_directions[self.NE],bounds):
+                yield dist + dz*climb, base + (r+dr)*self._cols + c+dc
+        reachable = [ zz for zz in range(self._layers) if abs(zz-z)*climb <= n ]
+        return heapq.merge( *[ layer_tiles(zz) for zz in reachable ] )
+
 
 
 
-        
 class HexVertical(AbstractGeometry):
     """
     Implements the methods of AbstractGeometry for a hexagon grid map with vertical edges
@@ -150,43 +485,146 @@ class HexVertical(AbstractGeometry):
     The first (bottom) row will be a short one. An odd number of rows is recommended for symmetry.
     """
     def __init__(self,cols,rows):
+        self._cols = cols
+        self._rows = rows
         # determine the number of map tiles given the desired width/height (in tiles)
         self.num_tiles = (cols*rows) - (rows//2) - (rows%2)
-        # set up internal tile-to-coordinate system
-        self.tile_to_coords = []
-        for r in range(rows):
-            adjcols = cols if (r%2) else (cols - 1) # odd numbered rows have 1 fewer column
-            for c in range(adjcols):
-                self.tile_to_coords.append((r,c))
-        # set up coordinate-to-tile lookup dictionary (reverse of above)
-        self.coords_to_tile = dict( zip(self.tile_to_coords,range(self.num_tiles)) )
+        # tile numbers run along each row from the bottom, and even rows have 1 fewer column, so every pair
+        # of rows holds 2*cols-1 tiles; coordinates are worked out with arithmetic (see _coords) rather than stored
+        self.tile_to_coords = TileToCoordsView(self)
+        self.coords_to_tile = CoordsToTileView(self)
         # define valid directions for this geometry, and their distance multipliers
         self.valid_directions = { self.EAST:1, self.NE:1, self.NW:1, self.WEST:1, self.SW:1, self.SE:1 }
         # moves in this geometry are implemented differently in odd and even rows, so we'll create two dictionaries for directional adjustments
         self.adj = [ { self.EAST: (0,1), self.NE: (1,1), self.NW: (1,0), self.WEST: (0,-1), self.SW: (-1,0), self.SE: (-1,1) } ,  # for even rows
                      { self.EAST: (0,1), self.NE: (1,0), self.NW: (1,-1), self.WEST: (0,-1), self.SW: (-1,-1), self.SE: (-1,0) }]  # for odd rows
+    def _coords(self,tile):
+        # (row,col) of a tile
+        pair,c = divmod(tile,2*self._cols-1)
+        if c < self._cols-1: return 2*pair, c # in the short (even) row of the pair
+        else: return 2*pair+1, c-(self._cols-1) # in the long (odd) row
+    def _tile(self,row,col):
+        # tile # at (row,col), or None if that's off the map
+        if 0 <= row < self._rows and 0 <= col < self._row_length(row): return self._row_start(row) + col
+        else: return None
+    def rows(self):
+        return self._rows
+    def cols(self):
+        return self._cols
+    def row(self,tile):
+        # return the row of a given tile
+        return self._coords(tile)[0]
+    def col(self,tile):
+        # return the column of a given tile
+        return self._coords(tile)[1]
+    def tile_at_coords(self, row, col):
+        t = self._tile(row,col)
+        if t is None: return False
+        else: return t
     def raw_xy(self,tile,tilewidth,tileheight):
         # return the x,y offset from the abstract map origin for a given tile for a given tile size
         # (not necessarily where it will appear on screen -- another object will adjust the "viewport")
-        r,c = self.tile_to_coords[tile]
+        r,c = self._coords(tile)
         if r%2: return (c*tilewidth),(r*tileheight) #formula for even (short) rows
         else: return ((c*tilewidth)+tilewidth//2),(r*tileheight) #formula for odd (long) rows   
     def dir_distance(self,direction):
         # return the distance of a "step" in this direction (e.g. using pythagorean theorem or other math)
         if not direction in self.valid_directions: return None
         else: return self.valid_directions[direction]
-    def adjacent(self,origin,direction):
-        # returns the tile # adjacent to the current one in the specified direction, or None.
-        # (None means either the direction is invalid in this geometry, or the adjacent tile is off the map)
-        if not direction in self.valid_directions: return None
-        else:
-            origin_coords = self.tile_to_coords[origin]
-            # the adjustments that correspond to each direction are different in even/odd rows
-            adjustment = self.adj[ origin_coords[0]%2 ]  # get the geometry's dictionary of move-to adjustments
-            # add the origin_coords and the adj. to get the move-to coordinates
-            move_to_coords = tuple(sum(q) for q in zip(origin_coords,adjustment[direction]))
-            if move_to_coords in self.coords_to_tile: return self.coords_to_tile[move_to_coords]
-            else: return None # if the move is off the map
+    def _row_start(self,r):
+        # the tile # of the first tile in row r (every even row before it is one tile short)
+        return r*self._cols - (r+1)//2
+    def _row_length(self,r):
+        return self._cols if (r%2) else (self._cols - 1)
+    def _row_adj(self,r):
+        # coordinate adjustments for a step in each direction from row r
+        return self.adj[ r%2 ]
+    # CUBE COORDINATES: hex math is much simpler in "cube" coordinates (x,y,z) with x+y+z = 0, where each of
+    # the six directions adds 1 to one coordinate and takes 1 from another.  Here x is the "axial" q (which
+    # runs along the row, but shifts half a step left with every row up), z is the row, and y = -x-z.
+    cube_directions = { AbstractGeometry.EAST: (1,-1,0), AbstractGeometry.NE: (0,-1,1), AbstractGeometry.NW: (-1,0,1),
+                        AbstractGeometry.WEST: (-1,1,0), AbstractGeometry.SW: (0,1,-1), AbstractGeometry.SE: (1,0,-1) }
+    def _axial(self,tile):
+        # (q,r) of a tile: the x and z of its cube coordinates
+        r,c = self._coords(tile)
+        return (2*c + 2 - (r%2) - r)//2, r
+    def _axial_tile(self,q,r):
+        # tile # at axial (q,r), or None if that's off the map
+        return self._tile( r, (2*q - 2 + (r%2) + r)//2 )
+    def cube(self,tile):
+        # return the cube coordinates (x,y,z) of a tile
+        q,r = self._axial(tile)
+        return q, -q-r, r
+    def tile_at_cube(self,x,y,z):
+        # return the tile # at cube coordinates (x,y,z), or None if that's off the map
+        return self._axial_tile(x,z)
+    def distance(self,origin,destination):
+        # number of hex steps between two tiles
+        q1,r1 = self._axial(origin)
+        q2,r2 = self._axial(destination)
+        dq,dr = q1-q2,r1-r2
+        return (abs(dq) + abs(dr) + abs(dq+dr))//2
+    def distance_many(self,origin,tiles):
+        # return an array('i') of the hex distances from the origin to each of a sequence of tiles
+        q0,r0 = self._axial(origin)
+        pairsize, short = 2*self._cols-1, self._cols-1
+        out = array('i')
+        for t in tiles:
+            # the same arithmetic as _coords() and _axial(), inlined to save two calls per tile
+            pair,c = divmod(t,pairsize)
+            if c < short: r = 2*pair; q = c + 1 - pair
+            else: r = 2*pair+1; q = c - short - pair
+            dq,dr = q-q0,r-r0
+            out.append( (abs(dq) + abs(dr) + abs(dq+dr))//2 )
+        return out
+    def cube_many(self,tiles):
+        # return three array('i')s holding the x, y and z cube coordinates of each of a sequence of tiles
+        xs,ys,zs = array('i'),array('i'),array('i')
+        pairsize, short = 2*self._cols-1, self._cols-1
+        for t in tiles:
+            pair,c = divmod(t,pairsize)
+            if c < short: r = 2*pair; q = c + 1 - pair
+            else: r = 2*pair+1; q = c - short - pair
+            xs.append(q)
+            ys.append(-q-r)
+            zs.append(r)
+        return xs,ys,zs
+    def line(self,origin,destination):
+        # return the list of tiles on a straight line from origin to destination (both included), one per step,
+        # found by sampling evenly along the line in cube coordinates and rounding to the nearest hex.
+        # (the ragged left and right edges of the map aren't straight in hex terms, so a line between two tiles
+        # near an edge can clip a hex that isn't on the map; those are left out)
+        n = self.distance(origin,destination)
+        if n == 0: return [origin]
+        x1,y1,z1 = self.cube(origin)
+        x2,y2,z2 = self.cube(destination)
+        # nudge the end point very slightly so samples that land exactly on an edge between hexes round consistently
+        x2,y2,z2 = x2+1e-6, y2+1e-6, z2-2e-6
+        tiles = []
+        for i in range(n+1):
+            f = i/n
+            t = self.tile_at_cube( *cube_round(x1+(x2-x1)*f, y1+(y2-y1)*f, z1+(z2-z1)*f) )
+            if t is not None: tiles.append(t)
+        return tiles
+    def ring(self,center,radius):
+        # generate the tiles exactly 'radius' steps from the center, going around it (clipped at the map edges)
+        if radius == 0:
+            yield center
+            return
+        x,y,z = self.cube(center)
+        dx,dy,dz = self.cube_directions[self.SW]
+        x,y,z = x+dx*radius, y+dy*radius, z+dz*radius # start 'radius' steps away and walk around the six sides
+        for side in (self.EAST,self.NE,self.NW,self.WEST,self.SW,self.SE):
+            dx,dy,dz = self.cube_directions[side]
+            for i in range(radius):
+                t = self.tile_at_cube(x,y,z)
+                if t is not None: yield t
+                x,y,z = x+dx, y+dy, z+dz
+    def _within(self,origin,n):
+        q,r = self._axial(origin)
+        for dist,dq,dr in hex_offsets(n,(-r,self._rows-1-r)):
+            t = self._axial_tile(q+dq,r+dr)
+            if t is not None: yield dist, t
 
         
 
@@ -202,6 +640,368 @@ class HexVertical(AbstractGeometry):
 
 
         
+
+def cube_round(x,y,z):
+    # round fractional cube coordinates to the nearest hex: round each one, then fix up the one that moved
+    # the most so that x+y+z = 0 still holds
+    rx,ry,rz = round(x),round(y),round(z)
+    dx,dy,dz = abs(rx-x),abs(ry-y),abs(rz-z)
+    if dx > dy and dx > dz: rx = -ry-rz
+    elif dy > dz: ry = -rx-rz
+    else: rz = -rx-ry
+    return rx,ry,rz
+
+
+# OFFSET TEMPLATES: every offset within n steps of an origin, sorted from nearest to farthest.
+# These only depend on the radius, so small ones are computed once and kept in a small LRU cache; bigger ones
+# (up to the whole map) are made ring by ring as they're used, and only the rings' offsets that land on the map.
+SMALL_TEMPLATE = 32 # the biggest radius whose template is cached
+
+def square_offsets(n,diagonal,bounds=None):
+    # generate square_template(n,diagonal) in the same order, keeping only the offsets inside
+    # bounds = (lowest drow, highest drow, lowest dcol, highest dcol) if given
+    if bounds is None: bounds = (-n,n,-n,n)
+    lo_r, hi_r, lo_c, hi_c = bounds
+    if n <= SMALL_TEMPLATE:
+        for entry in square_template(n,diagonal):
+            if lo_r <= entry[1] <= hi_r and lo_c <= entry[2] <= hi_c: yield entry
+        return
+    last = min( n, max(-lo_r,hi_r,-lo_c,hi_c) ) # rings past this one are entirely outside the bounds
+    heap, ring = [], 0
+    while True:
+        # every offset in ring k (max(|dr|,|dc|) == k) is at least k away, so ring k is added to the heap
+        # before anything that far is yielded
+        while ring <= last and (not heap or heap[0][0] >= ring):
+            for entry in _square_ring(ring,diagonal,lo_r,hi_r,lo_c,hi_c): heapq.heappush(heap,entry)
+            ring += 1
+        if not heap: return
+        yield heapq.heappop(heap)
+
+def _square_ring(k,diagonal,lo_r,hi_r,lo_c,hi_c):
+    # (distance,drow,dcol) for the offsets k steps out, inside the bounds
+    if k == 0:
+        yield 0, 0, 0
+        return
+    extra = diagonal-1
+    cols = range( max(-k,lo_c), min(k,hi_c)+1 )
+    for dr in (-k,k):
+        if lo_r <= dr <= hi_r:
+            for dc in cols: yield k + extra*abs(dc), dr, dc
+    for dc in (-k,k):
+        if lo_c <= dc <= hi_c:
+            for dr in range( max(-k+1,lo_r), min(k-1,hi_r)+1 ): yield k + extra*abs(dr), dr, dc
+
+def hex_offsets(n,bounds=None):
+    # generate hex_template(n) in the same order, keeping only the offsets with lowest <= dr <= highest
+    # if bounds = (lowest,highest) is given; every offset in a ring is the same distance away
+    lo_r, hi_r = bounds if bounds is not None else (-n,n)
+    if n <= SMALL_TEMPLATE:
+        for entry in hex_template(n):
+            if lo_r <= entry[2] <= hi_r: yield entry
+        return
+    for k in range(n+1):
+        for dr in range( max(-k,lo_r), min(k,hi_r)+1 ):
+            first, last = max(-k,-k-dr), min(k,k-dr)
+            for dq in (range(first,last+1) if abs(dr) == k else sorted({first,last})): yield k, dq, dr
+
+@lru_cache(maxsize=32)
+def square_template(n,diagonal):
+    # (distance,drow,dcol) for a rectangular map with 8-way moves (a diagonal step costs 'diagonal')
+    offsets = []
+    for dr in range(-n,n+1):
+        for dc in range(-n,n+1):
+            a,b = abs(dr),abs(dc)
+            offsets.append( (max(a,b) + (diagonal-1)*min(a,b), dr, dc) )
+    offsets.sort()
+    return tuple(offsets)
+
+@lru_cache(maxsize=32)
+def hex_template(n):
+    # (distance,dq,dr) in axial hex coordinates
+    offsets = []
+    for dr in range(-n,n+1):
+        for dq in range( max(-n,-n-dr), min(n,n-dr)+1 ):
+            offsets.append( ((abs(dq) + abs(dr) + abs(dq+dr))//2, dr, dq) )
+    offsets.sort()
+    return tuple( (dist,dq,dr) for dist,dr,dq in offsets )
+
+
+
+class TileToCoordsView(Sequence):
+    """
+    Read-only stand-in for the old tile_to_coords list of (row,col) tuples.
+    Entries are computed by the geometry when asked for, so it costs no memory however big the map is.
+    """
+    def __init__(self,geom):
+        self._geom = geom
+    def __len__(self):
+        return self._geom.num_tiles
+    def __getitem__(self,tile):
+        if not (0 <= tile < self._geom.num_tiles): raise IndexError(tile)
+        return self._geom._coords(tile)
+
+
+class StepView(Sequence):
+    """
+    Read-only stand-in for a neighbor table on maps too big to tabulate: entry t is the tile one (dr,dc)
+    step from tile t, or -1 if that step leaves the map.
+    """
+    def __init__(self,geom,dr,dc):
+        self._geom = geom
+        self._dr, self._dc = dr, dc
+    def __len__(self):
+        return self._geom.num_tiles
+    def __getitem__(self,tile):
+        r,c = divmod(tile,self._geom._cols)
+        t = self._geom._tile(r+self._dr,c+self._dc)
+        return -1 if t is None else t
+
+
+class CoordsToTileView(Mapping):
+    """
+    Read-only stand-in for the old coords_to_tile dictionary, from (row,col) tuples to tile #s.
+    """
+    def __init__(self,geom):
+        self._geom = geom
+    def __len__(self):
+        return self._geom.num_tiles
+    def __iter__(self):
+        return iter(TileToCoordsView(self._geom))
+    def __getitem__(self,coords):
+        t = self._geom._tile(*coords)
+        if t is None: raise KeyError(coords)
+        return t
+
+
+class TileRect:
+    """
+    A rectangle of tiles on a Rectangle8 map, kept as its corner and size instead of a set of tile #s.
+    Each row of the rectangle is a run of consecutive tile #s, so membership is a divmod and two comparisons,
+    and the difference between two rectangles comes back as a handful of row spans (see TileSpans).
+    """
+    def __init__(self,map_cols,corner_row,corner_col,rows,cols):
+        self._map_cols = map_cols
+        self.corner_row, self.corner_col = corner_row, corner_col
+        self.rows, self.cols = max(rows,0), max(cols,0)
+    def __contains__(self,tile):
+        r, c = divmod(tile,self._map_cols)
+        return self.corner_row <= r < self.corner_row+self.rows and self.corner_col <= c < self.corner_col+self.cols
+    def __len__(self):
+        return self.rows*self.cols
+    def __iter__(self):
+        return iter(self.spans())
+    def __eq__(self,other):
+        if not isinstance(other,TileRect): return NotImplemented
+        return self._key() == other._key()
+    def __hash__(self):
+        return hash(self._key())
+    def _key(self):
+        if not self: return (self._map_cols,) # all empty rectangles are alike
+        return (self._map_cols,self.corner_row,self.corner_col,self.rows,self.cols)
+    def spans(self):
+        "return the rectangle as a TileSpans, one span per row"
+        start = self.corner_row*self._map_cols + self.corner_col
+        if not self.cols: return TileSpans([])
+        return TileSpans([ range(s,s+self.cols) for s in range(start,start+self.rows*self._map_cols,self._map_cols) ])
+    def difference(self,other):
+        "return a TileSpans of the tiles in this rectangle but not in the other one (which may be None)"
+        if not other or other._map_cols != self._map_cols: return self.spans()
+        o_r0, o_r1 = other.corner_row, other.corner_row + other.rows
+        o_c0, o_c1 = other.corner_col, other.corner_col + other.cols
+        c0, c1 = self.corner_col, self.corner_col + self.cols
+        spans = []
+        for r in range(self.corner_row,self.corner_row+self.rows):
+            base = r*self._map_cols
+            if not (o_r0 <= r < o_r1) or o_c1 <= c0 or c1 <= o_c0:
+                spans.append( range(base+c0,base+c1) ) # the other rectangle misses this row: keep all of it
+                continue
+            if c0 < o_c0: spans.append( range(base+c0,base+o_c0) ) # the part left of the other rectangle
+            if o_c1 < c1: spans.append( range(base+o_c1,base+c1) ) # and the part right of it
+        return TileSpans(spans)
+    __sub__ = difference
+
+
+class TileSpans:
+    """
+    A set of tiles kept as a list of ranges of consecutive tile #s (e.g. what's left of a TileRect after
+    another one is taken away).  Membership tests each span, so it's meant for a few spans, not thousands.
+    """
+    def __init__(self,spans):
+        self._spans = [ s for s in spans if s ]
+    def __contains__(self,tile):
+        return any( tile in s for s in self._spans )
+    def __len__(self):
+        return sum( len(s) for s in self._spans )
+    def __iter__(self):
+        for span in self._spans:
+            yield from span
+    def spans(self):
+        return list(self._spans)
+
+
+class TileSet:
+    """
+    A set of tile #s from 0 to size-1, stored as a bitmap with one bit per tile in a bytearray.
+    Adding, removing and testing a tile touch a single byte.  &, | and - between two TileSets work on the
+    whole bitmap at once (as big ints); with a TileRect or TileSpans only the bytes under its spans are read
+    (see tiles_in()), so intersecting a change queue with the view costs the size of the view, not the map.
+    Iterating and pop() skip empty stretches of the map with a regular expression search, so a change queue
+    covering every tile of a 100x100 map is 1.25 kB instead of 10,000 ints in a set.
+    The other operand of &, | or - may be another TileSet of the same size, a TileRect, TileSpans or any
+    iterable of tile #s.
+    """
+    def __init__(self,size,tiles=(),full=False):
+        self._size = size
+        self._bits = bytearray( (size+63)//64 * 8 ) # padded to whole 64-bit words
+        self._count = 0
+        self._first = 0 # no byte before this one has a bit set (where pop() starts looking)
+        if full: self.add_range(0,size)
+        else: self.update(tiles)
+    def size(self):
+        return self._size
+    def __len__(self):
+        return self._count
+    def __bool__(self):
+        return self._count > 0
+    def __contains__(self,tile):
+        return 0 <= tile < self._size and (self._bits[tile >> 3] >> (tile & 7)) & 1 == 1
+    def __iter__(self):
+        # iterates over a snapshot, so the set may be changed while it's being walked
+        if not self._count: return
+        yield from _set_bits(bytes(self._bits),0,len(self._bits))
+    def tiles_in(self,tiles):
+        # generate the tiles of this set that are also in a TileRect, TileSpans or range (in order, span by span),
+        # reading only the bytes under those spans
+        if isinstance(tiles,TileRect): tiles = tiles.spans()
+        spans = tiles.spans() if isinstance(tiles,TileSpans) else [tiles]
+        if not self._count: return
+        bits = self._bits
+        for span in spans:
+            start, stop = max(span.start,0), min(span.stop,self._size)
+            if start >= stop: continue
+            first = start >> 3
+            word = int.from_bytes(bits[first:((stop-1) >> 3)+1],"little") >> (start & 7)
+            word &= (1 << (stop-start)) - 1
+            while word:
+                low = word & -word
+                yield start + low.bit_length() - 1
+                word ^= low
+    def __eq__(self,other):
+        if not isinstance(other,TileSet): return NotImplemented
+        return self._size == other._size and self._bits == other._bits
+    def __repr__(self):
+        return "TileSet(%d, %r)" % (self._size,list(self))
+    def add(self,tile):
+        if not 0 <= tile < self._size: raise IndexError(tile)
+        mask = 1 << (tile & 7)
+        if not self._bits[tile >> 3] & mask:
+            self._bits[tile >> 3] |= mask
+            self._count += 1
+            if tile >> 3 < self._first: self._first = tile >> 3
+    def discard(self,tile):
+        if tile in self:
+            self._bits[tile >> 3] &= ~(1 << (tile & 7)) & 0xFF
+            self._count -= 1
+    def remove(self,tile):
+        if tile not in self: raise KeyError(tile)
+        self.discard(tile)
+    def pop(self):
+        # remove and return the lowest tile, searching on from where the last pop() left off
+        if not self._count: raise KeyError("pop from an empty TileSet")
+        i = _NONZERO.search(self._bits,self._first).start()
+        self._first = i
+        byte = self._bits[i]
+        tile = (i << 3) + (byte & -byte).bit_length() - 1
+        self._bits[i] = byte & (byte-1)
+        self._count -= 1
+        return tile
+    def clear(self):
+        self._bits[:] = bytes(len(self._bits))
+        self._count = 0
+        self._first = 0
+    def copy(self):
+        return self._with_int( self._int() )
+    def add_range(self,start,stop):
+        # add the tiles start..stop-1 a byte at a time (for the rows of a TileRect, or the whole map)
+        if start >= stop: return
+        if start < 0 or stop > self._size: raise IndexError( (start,stop) )
+        bits = self._bits
+        first, last = start >> 3, (stop-1) >> 3
+        self._first = min(self._first,first)
+        before = popcount(int.from_bytes(bits[first:last+1],"little"))
+        if first == last:
+            bits[first] |= ((1 << (stop-start)) - 1) << (start & 7)
+        else:
+            bits[first] |= (0xFF << (start & 7)) & 0xFF
+            bits[first+1:last] = b"\xff" * (last-first-1)
+            bits[last] |= (1 << (((stop-1) & 7) + 1)) - 1
+        self._count += popcount(int.from_bytes(bits[first:last+1],"little")) - before
+    def update(self,tiles):
+        if isinstance(tiles,TileSet):
+            self._set_int( self._int() | self._coerce(tiles)._int() )
+            return
+        if isinstance(tiles,TileRect): tiles = tiles.spans()
+        if isinstance(tiles,TileSpans):
+            for span in tiles.spans(): self.add_range(span.start,span.stop)
+        elif isinstance(tiles,range) and tiles.step == 1:
+            self.add_range(tiles.start,tiles.stop)
+        else:
+            for tile in tiles: self.add(tile)
+    def __and__(self,other):
+        if isinstance(other,(TileRect,TileSpans,range)):
+            result = TileSet(self._size)
+            for tile in self.tiles_in(other): result.add(tile)
+            return result
+        return self._with_int( self._int() & self._coerce(other)._int() )
+    def __or__(self,other):
+        return self._with_int( self._int() | self._coerce(other)._int() )
+    def __sub__(self,other):
+        return self._with_int( self._int() & ~self._coerce(other)._int() )
+    def __iand__(self,other):
+        self._set_int( self._int() & self._coerce(other)._int() )
+        return self
+    def __ior__(self,other):
+        self.update(other)
+        return self
+    def __isub__(self,other):
+        self._set_int( self._int() & ~self._coerce(other)._int() )
+        return self
+    def _coerce(self,other):
+        if isinstance(other,TileSet):
+            if other._size != self._size: raise ValueError("TileSets of different sizes: %d and %d" % (self._size,other._size))
+            return other
+        return TileSet(self._size,other)
+    def _int(self):
+        return int.from_bytes(self._bits,"little")
+    def _set_int(self,value):
+        self._bits[:] = value.to_bytes(len(self._bits),"little")
+        self._count = popcount(value)
+        self._first = 0
+    def _with_int(self,value):
+        result = TileSet(self._size)
+        result._set_int(value)
+        return result
+
+def popcount(x):
+    # the number of bits set in a non-negative int (int.bit_count() only arrived in Python 3.10)
+    return bin(x).count("1")
+
+_NONZERO = re.compile(rb"[^\x00]") # finds the next byte of a bitmap with any bit set
+_NONZERO_RUN = re.compile(rb"[^\x00]+")
+
+def _set_bits(bits,start,stop):
+    # generate the #s of the set bits in bytes start..stop-1 of a bitmap, skipping runs of zero bytes
+    for run in _NONZERO_RUN.finditer(bits,start,stop):
+        base = run.start() << 3
+        word = int.from_bytes(run.group(),"little")
+        while word:
+            low = word & -word
+            yield base + low.bit_length() - 1
+            word ^= low
+
+
+
+
         
 if __name__ == "__main__":
     "UNIT TEST CODE"
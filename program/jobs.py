@@ -0,0 +1,86 @@
+"running long jobs a slice at a time, so they don't hold up the window"
+import time
+from collections import deque
+
+
+
+class JobScheduler:
+    """
+    Runs generator-based jobs (such as pathfinding.path_job) a slice at a time.  Each next() on a job should
+    do a bounded amount of work and yield; tick() keeps resuming the jobs in turn until budget_ms milliseconds
+    have gone by, then returns, so the window gets the rest of the frame.  When a job finishes, its callback
+    (if any) is called with the job's return value.  After start(), tick() is called every frame by the pyglet
+    clock, but only while there are jobs queued: an empty scheduler takes itself off the clock, so the window
+    can go back to sleeping until the next event.
+    """
+
+    def __init__(self,budget_ms=4):
+        self._budget = budget_ms / 1000.0
+        self._jobs = deque() # (job, callback) pairs waiting for their next slice
+        self.slices = 0 # slices run so far (handy for profiling)
+        self._started = False # start() has been called (and stop() hasn't)
+        self._scheduled = False # tick() is on the pyglet clock
+
+    def add(self,job,callback=None):
+        # queue a job; returns the job so it can be cancelled later
+        self._jobs.append( (job,callback) )
+        if self._started: self._schedule()
+        return job
+
+    def cancel(self,job):
+        for entry in list(self._jobs):
+            if entry[0] is job: self._jobs.remove(entry)
+        job.close()
+        if not self._jobs: self._unschedule()
+
+    def pending(self):
+        return len(self._jobs)
+
+    def tick(self,dt=None):
+        # run slices of the queued jobs, round robin, until the time budget is spent or there's nothing left to do
+        deadline = time.perf_counter() + self._budget
+        while self._jobs and time.perf_counter() < deadline:
+            job, callback = self._jobs.popleft()
+            self.slices += 1
+            try:
+                next(job)
+            except StopIteration as finished:
+                if callback: callback(finished.value)
+                continue
+            self._jobs.append( (job,callback) )
+        if not self._jobs: self._unschedule() # nothing left: stop asking for frames
+
+    def start(self):
+        self._started = True
+        if self._jobs: self._schedule()
+
+    def stop(self):
+        self._started = False
+        self._unschedule()
+
+    def _schedule(self):
+        if self._scheduled: return
+        import pyglet
+        pyglet.clock.schedule(self.tick)
+        self._scheduled = True
+
+    def _unschedule(self):
+        if not self._scheduled: return
+        import pyglet
+        pyglet.clock.unschedule(self.tick)
+        self._scheduled = False
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry, pathfinding
+    rect = geometry.Rectangle8(200,200)
+    scheduler = JobScheduler(budget_ms=2)
+    scheduler.add( pathfinding.path_job(rect,0,rect.tilecount()-1,expansions=50), lambda path: print("found",len(path)) )
+    frames = 0
+    while scheduler.pending():
+        scheduler.tick()
+        frames += 1
+    print( frames, "frames,", scheduler.slices, "slices" )
@@ -0,0 +1,107 @@
+"line of sight: can one tile be seen from another?"
+import fov
+
+
+
+class LineOfSight:
+    """
+    Answers "can tile A see tile B?" on a Level with a Rectangle8 geometry, using the same symmetric
+    shadowcasting as fov.FieldOfView over the see-through flags of the Level's terrain types.  Only the tiles
+    between the two ends have to be transparent, so a wall can be seen, but a wall (like a floor) only counts
+    as seen if its center is lit; that makes the answer symmetric: if A can see B then B can see A.
+    los() and los_many() use the same rule, so they always agree.  Answers are memoised per pair of tiles,
+    and the memo is cleared whenever the Level's terrain changes (it listens to the Level, so the Viewport's
+    change queue is left alone).
+    """
+
+    def __init__(self,level,max_entries=100000):
+        self._level = level
+        self._geom = level.geometry()
+        self._memo = {} # (tile,tile) -> True/False, with the lower tile # first
+        self._max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._level.add_terrain_listener(self._terrain_changed)
+
+    def close(self):
+        # stop listening to the Level (call this when the LineOfSight is no longer needed)
+        self._level.remove_terrain_listener(self._terrain_changed)
+
+    def los(self,a,b):
+        """
+        Return True if tile a can see tile b.  This shadowcasts the octant(s) from a that hold b, out to b's
+        distance, so an unmemoised answer costs about the square of the distance; when many tiles are to be
+        checked against the same one, los_many() does them all with a single scan.
+        """
+        if a == b: return True
+        key = (a,b) if a < b else (b,a)
+        if key in self._memo:
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        cols = self._geom.cols()
+        dr, dc = b//cols - a//cols, b%cols - a%cols
+        reach = max(abs(dr),abs(dc))
+        seen = any( b in fov.scan(self._level,a,fov.OCTANTS[o],reach,symmetric=True) for o in fov.octants_of(dr,dc) )
+        self._remember(key,seen)
+        return seen
+
+    def los_many(self,observers,target,radius=None):
+        """
+        Return a list of True/False, one for each observer, saying whether it can see the target (by the same
+        rule as los()).  Observers more than 'radius' steps away (if given) can't.  Observers already in the
+        memo are answered from it; the rest are answered from one scan around the target, covering only the
+        octants they are in and reaching only as far as the farthest of them, and their answers are memoised.
+        """
+        cols = self._geom.cols()
+        tr, tc = divmod(target,cols)
+        results = []
+        pending = [] # (index in results, observer, key) of the observers the memo can't answer
+        octants = set()
+        reach = 0
+        for o in observers:
+            dr, dc = o//cols - tr, o%cols - tc
+            steps = max(abs(dr),abs(dc))
+            if radius is not None and steps > radius:
+                results.append(False)
+                continue
+            key = (o,target) if o < target else (target,o)
+            if o == target:
+                results.append(True)
+            elif key in self._memo:
+                self.hits += 1
+                results.append( self._memo[key] )
+            else:
+                self.misses += 1
+                pending.append( (len(results),o,key) )
+                results.append(None)
+                octants.update( fov.octants_of(dr,dc) )
+                reach = max(reach,steps)
+        if pending:
+            seen = set()
+            for o in octants: seen |= fov.scan(self._level,target,fov.OCTANTS[o],reach,symmetric=True)
+            for i,o,key in pending:
+                results[i] = o in seen
+                self._remember(key,results[i])
+        return results
+
+    def _remember(self,key,seen):
+        if len(self._memo) >= self._max_entries: self._memo.clear() # crude, but keeps memory bounded
+        self._memo[key] = seen
+
+    def _terrain_changed(self,tile):
+        self._memo.clear()
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry, gamedata
+    level = gamedata.Level( geometry.Rectangle8(21,21), gamedata.Grass() )
+    for r in range(5,16): level.place_terrain( gamedata.Wall(), level.geometry().tile_at_coords(r,14) )
+    sight = LineOfSight(level)
+    target = level.geometry().tile_at_coords(10,10)
+    seen = sight.los_many( range(21*21), target )
+    for r in range(20,-1,-1):
+        print( "".join( ("." if level.transparency()[t] else "#") if seen[t] else " " for t in range(r*21,(r+1)*21) ) )
@@ -0,0 +1,702 @@
+"pathfinding routines that work on any AbstractGeometry"
+import heapq
+from collections import OrderedDict, defaultdict
+
+INFINITY = float("inf")
+
+
+
+class AStar:
+    """
+    A* search over the tiles of an AbstractGeometry.
+    The g-score and parent tables are flat arrays indexed by tile#, sized to the geometry's tilecount()
+    and allocated once (by geom.tile_store(), so a chunked geometry only allocates the chunks a search
+    reaches), then reused by every search.  Instead of clearing them between searches, each
+    search gets a new "generation" number and a tile's entries only count if its stamp matches.
+    The open set is a binary heap (heapq) of (f-score, tile) tuples; stale entries are skipped when popped.
+    """
+
+    def __init__(self,geom):
+        self._geom = geom
+        self._g = geom.tile_store(0.0,'d')  # best known cost from the origin to each tile
+        self._parent = geom.tile_store(-1,'l')  # the tile we came from on that best known path
+        self._seen = geom.tile_store(0,'L')  # generation in which g/parent were last written
+        self._closed = geom.tile_store(0,'L')  # generation in which the tile was expanded
+        self._generation = 0
+        self.expanded = 0  # number of tiles expanded by the most recent search (handy for profiling)
+
+    def _next_generation(self):
+        self._generation += 1
+        if self._generation > 0xFFFFFFFF:
+            # the stamps are about to overflow: wipe them and start counting again
+            self._seen = self._geom.tile_store(0,'L')
+            self._closed = self._geom.tile_store(0,'L')
+            self._generation = 1
+        return self._generation
+
+    def search(self,origin,destination,cost=None):
+        """
+        Return a list of tile #s from origin to destination (both included), or None if there's no path.
+        cost(tile) should return the cost multiplier (1 or more) for entering a tile, or None if it can't be entered.
+        """
+        if cost is None: cost = lambda tile: 1  # every tile passable at the same cost
+        if origin == destination: return [origin]
+        if cost(destination) is None: return None  # don't bother searching for a way into a wall
+        geom = self._geom
+        steps = [ (geom.neighbor_tables[d],geom.dir_distance(d)) for d in sorted(geom.neighbor_tables) ]
+        g, parent, seen, closed = self._g, self._parent, self._seen, self._closed
+        gen = self._next_generation()
+        heappush, heappop = heapq.heappush, heapq.heappop
+        estimate = geom.distance
+
+        g[origin] = 0.0
+        parent[origin] = -1
+        seen[origin] = gen
+        openset = [ (estimate(origin,destination),origin) ]
+        expanded = 0
+        while openset:
+            f,t = heappop(openset)
+            if closed[t] == gen: continue  # a stale heap entry; we already expanded this tile more cheaply
+            if t == destination:
+                self.expanded = expanded
+                return self._trace(destination)
+            closed[t] = gen
+            expanded += 1
+            gt = g[t]
+            for table,step in steps:
+                n = table[t]
+                if n < 0 or closed[n] == gen: continue  # off the map, or already expanded
+                c = cost(n)
+                if c is None: continue  # impassable
+                ng = gt + step*c
+                if seen[n] != gen or ng < g[n]:
+                    seen[n] = gen
+                    g[n] = ng
+                    parent[n] = t
+                    heappush(openset,(ng+estimate(n,destination),n))
+        self.expanded = expanded
+        return None  # ran out of tiles to explore
+
+    def _trace(self,tile):
+        # follow the parent table back to the origin
+        path = []
+        while tile != -1:
+            path.append(tile)
+            tile = self._parent[tile]
+        path.reverse()
+        return path
+
+
+
+
+def path_job(geom,origin,destination,cost=None,expansions=200):
+    """
+    A* search as a resumable job: a generator that expands at most 'expansions' tiles each time it's resumed,
+    yielding in between, and finally returns the path (a list of tile #s, both ends included) or None.
+    Run it with a jobs.JobScheduler, or by hand with next() until StopIteration, whose .value is the path.
+    Each job keeps its own search state in dictionaries, so any number can be under way at once; but the
+    terrain may change while a job waits, so a path from a long job should be checked as it's followed.
+    """
+    if cost is None: cost = lambda tile: 1
+    if origin == destination: return [origin]
+    if cost(destination) is None: return None
+    steps = [ (geom.neighbor_tables[d],geom.dir_distance(d)) for d in sorted(geom.neighbor_tables) ]
+    estimate = geom.distance
+    g = {origin: 0.0}
+    parent = {origin: -1}
+    closed = set()
+    openset = [ (estimate(origin,destination),origin) ]
+    budget = expansions
+    while openset:
+        if budget <= 0:
+            yield # end of this slice
+            budget = expansions
+        f,t = heapq.heappop(openset)
+        if t in closed: continue
+        if t == destination:
+            path = []
+            while t != -1:
+                path.append(t)
+                t = parent[t]
+            path.reverse()
+            return path
+        closed.add(t)
+        budget -= 1
+        gt = g[t]
+        for table,step in steps:
+            n = table[t]
+            if n < 0 or n in closed: continue
+            c = cost(n)
+            if c is None: continue
+            ng = gt + step*c
+            if ng < g.get(n,INFINITY):
+                g[n] = ng
+                parent[n] = t
+                heapq.heappush(openset,(ng+estimate(n,destination),n))
+    return None
+
+def no_path_job():
+    # a path_job that finishes as soon as it's run, having found no path
+    return None
+    yield
+
+
+
+
+class JumpPointSearch(AStar):
+    """
+    Jump point search (Harabor & Grastien) for a Rectangle8 geometry where every passable tile costs the same.
+    It finds the same shortest paths as A*, but instead of adding every neighbor to the open set it "jumps"
+    in straight lines and diagonals over open ground, only stopping at tiles where a wall forces a turn.
+    That cuts the number of tiles expanded by an order of magnitude or more, and bounding each jump by max_jump
+    keeps it from scanning out to the edge of open ground.  Rectangle8.path_from_to picks it when the cost
+    callback is missing or marked .uniform.  (Diagonal moves past corners are allowed, the same as in AStar.)
+    """
+
+    max_jump = 8 # the most steps a single jump may take before it stops at a jump point
+
+    def search(self,origin,destination,cost=None):
+        """
+        Return a list of tile #s from origin to destination (both included), or None if there's no path.
+        cost(tile) should return None for impassable tiles and the same multiplier for every other tile.
+        """
+        if cost is None: cost = lambda tile: 1
+        if origin == destination: return [origin]
+        unit = cost(destination)
+        if unit is None: return None
+        geom = self._geom
+        rows, cols = geom.rows(), geom.cols()
+        goal_r, goal_c = divmod(destination,cols)
+
+        def free(r,c):
+            # can we stand on (r,c)?
+            return 0 <= r < rows and 0 <= c < cols and cost(r*cols+c) is not None
+
+        limit = self.max_jump
+
+        def jump(r,c,dr,dc):
+            # travel from (r,c) in direction (dr,dc) until reaching a jump point (returned as a tile #) or a dead end (None).
+            # Any tile on the way may also serve as a jump point, so a jump stops early (and is expanded from there
+            # like any other) after 'limit' steps or on reaching the goal's row or column; otherwise, in Python, the
+            # scans out to the edge of open ground cost far more than the expansions they save.
+            for i in range(limit):
+                r, c = r+dr, c+dc
+                if not free(r,c): return None
+                if r == goal_r or c == goal_c: return r*cols + c
+                if dr and dc:
+                    # diagonal: stop if a wall beside us opens up a shortcut, or if a straight jump from here finds something
+                    if (not free(r-dr,c) and free(r-dr,c+dc)) or (not free(r,c-dc) and free(r+dr,c-dc)): return r*cols + c
+                    if jump(r,c,dr,0) is not None or jump(r,c,0,dc) is not None: return r*cols + c
+                elif dr:
+                    if (not free(r,c+1) and free(r+dr,c+1)) or (not free(r,c-1) and free(r+dr,c-1)): return r*cols + c
+                else:
+                    if (not free(r+1,c) and free(r+1,c+dc)) or (not free(r-1,c) and free(r-1,c+dc)): return r*cols + c
+            return r*cols + c
+
+        def directions(t,p):
+            # the directions worth jumping in from tile t, which we reached from tile p
+            r, c = divmod(t,cols)
+            if p < 0: return ALL_DIRECTIONS
+            pr, pc = divmod(p,cols)
+            dr, dc = (r>pr)-(r<pr), (c>pc)-(c<pc)
+            if dr and dc:
+                dirs = [ (dr,0), (0,dc), (dr,dc) ]
+                if not free(r-dr,c): dirs.append( (-dr,dc) )
+                if not free(r,c-dc): dirs.append( (dr,-dc) )
+            elif dr:
+                dirs = [ (dr,0) ]
+                if not free(r,c+1): dirs.append( (dr,1) )
+                if not free(r,c-1): dirs.append( (dr,-1) )
+            else:
+                dirs = [ (0,dc) ]
+                if not free(r+1,c): dirs.append( (1,dc) )
+                if not free(r-1,c): dirs.append( (-1,dc) )
+            return dirs
+
+        g, parent, seen, closed = self._g, self._parent, self._seen, self._closed
+        gen = self._next_generation()
+        heappush, heappop = heapq.heappush, heapq.heappop
+        estimate = geom.distance
+
+        g[origin] = 0.0
+        parent[origin] = -1
+        seen[origin] = gen
+        openset = [ (unit*estimate(origin,destination),origin) ]
+        expanded = 0
+        while openset:
+            f,t = heappop(openset)
+            if closed[t] == gen: continue
+            if t == destination:
+                self.expanded = expanded
+                return self._fill_in( self._trace(destination) )
+            closed[t] = gen
+            expanded += 1
+            r, c = divmod(t,cols)
+            for dr,dc in directions(t,parent[t]):
+                n = jump(r,c,dr,dc)
+                if n is None or closed[n] == gen: continue
+                ng = g[t] + unit*estimate(t,n)  # jump points are in a straight line, so the octile distance is exact
+                if seen[n] != gen or ng < g[n]:
+                    seen[n] = gen
+                    g[n] = ng
+                    parent[n] = t
+                    heappush(openset,(ng+unit*estimate(n,destination),n))
+        self.expanded = expanded
+        return None
+
+    def _fill_in(self,jumppoints):
+        # turn a list of jump points into the full list of tiles stepped on between them
+        cols = self._geom.cols()
+        path = [ jumppoints[0] ]
+        for t in jumppoints[1:]:
+            r, c = divmod(path[-1],cols)
+            tr, tc = divmod(t,cols)
+            dr, dc = (tr>r)-(tr<r), (tc>c)-(tc<c)
+            while (r,c) != (tr,tc):
+                r, c = r+dr, c+dc
+                path.append( r*cols + c )
+        return path
+
+ALL_DIRECTIONS = ( (0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1), (-1,0), (-1,1) )
+
+
+
+
+class DijkstraMap:
+    """
+    A "Dijkstra map" (flow field) for a Level: every tile holds the cost of walking from it to the nearest of
+    one or more goal tiles, so any number of critters can chase the same goals by stepping "downhill" with
+    next_step(), at a cost of one neighbor-table lookup per direction instead of one search per critter.
+    The field is kept up to date incrementally when the goals change: added goals are seeded first and only lower
+    distances around themselves, then the tiles still closest to a removed goal (those whose distance got worse)
+    are reset and refilled from the edge of the area that's still valid.  When the removed goals own most of the
+    field, as when the only goal moves, that would touch nearly every tile twice, so the field is recomputed
+    from scratch instead.  A terrain change anywhere makes the next query recompute everything.
+    """
+
+    def __init__(self,level,goals=(),cost=None):
+        self._level = level
+        self._geom = level.geometry()
+        self._cost = cost or level.move_cost  # cost(tile): multiplier for entering a tile, or None if impassable
+        self._dist = self._geom.tile_store(INFINITY,'d')  # cost to the nearest goal
+        self._source = self._geom.tile_store(-1,'l')  # which goal that is
+        self._claimed = {}  # goal -> tiles that have been closest to it (may include tiles since claimed by another goal)
+        self._goals = set()
+        self._reached = 0  # number of tiles with a finite distance
+        self._stale = False
+        self._level.add_terrain_listener(self._terrain_changed)
+        self.set_goals(goals)
+
+    def close(self):
+        # stop listening to the Level (call this when the DijkstraMap is no longer needed)
+        self._level.remove_terrain_listener(self._terrain_changed)
+
+    def goals(self):
+        return set(self._goals)
+
+    def set_goals(self,goals):
+        "replace the set of goal tiles, updating only the part of the map that's affected"
+        goals = set(goals)
+        if self._stale: return self._rebuild(goals)
+        removed, added = self._goals - goals, goals - self._goals
+        dist, source = self._dist, self._source
+        if removed and removed == self._goals: return self._rebuild(goals)  # every tile belongs to a removed goal, e.g. the only goal moved
+        if removed:
+            owned = { t for g in removed for t in self._claimed.pop(g) if source[t] == g }
+            if 2*len(owned) > self._reached: return self._rebuild(goals)  # cheaper than resetting and refilling most of the map
+        self._goals = goals
+        # seed the new goals first, so the tiles they take over from removed goals don't have to be reset
+        frontier = []
+        for g in added:
+            if dist[g] == INFINITY: self._reached += 1
+            dist[g] = 0.0
+            source[g] = g
+            self._claimed[g] = [g]
+            frontier.append( (0.0,g) )
+        self._propagate(frontier)
+        if removed:
+            # forget every tile still closest to a goal that's going away...
+            lost = [ t for t in owned if source[t] in removed ]
+            for t in lost:
+                dist[t] = INFINITY
+                source[t] = -1
+            self._reached -= len(lost)
+            # ...and fill them in again from their neighbors that are still valid
+            edge = set()
+            for t in lost:
+                for n in self._geom.neighbors(t):
+                    if dist[n] < INFINITY: edge.add(n)
+            frontier = [ (dist[n],n) for n in edge ]
+            heapq.heapify(frontier)
+            self._propagate(frontier)
+
+    def distance(self,tile):
+        # the cost of walking from a tile to the nearest goal (infinite if it can't get there)
+        if self._stale: self._rebuild(self._goals)
+        return self._dist[tile]
+
+    def next_step(self,tile):
+        "return the neighboring tile that is the best step towards the nearest goal, or None if there's no better place to be"
+        if self._stale: self._rebuild(self._goals)
+        dist = self._dist
+        best, best_dist = None, dist[tile]
+        for n in self._geom.neighbors(tile):
+            if dist[n] < best_dist: best, best_dist = n, dist[n]
+        return best
+
+    def _terrain_changed(self,tile):
+        self._stale = True
+
+    def _rebuild(self,goals):
+        # recompute the whole field from scratch
+        self._dist = self._geom.tile_store(INFINITY,'d')
+        self._source = self._geom.tile_store(-1,'l')
+        self._claimed = {}
+        self._goals = set()
+        self._reached = 0
+        self._stale = False
+        self.set_goals(goals)
+
+    def _propagate(self,heap):
+        # Dijkstra outwards from the tiles on the heap, lowering any distances that can be improved
+        dist, source, claimed, cost = self._dist, self._source, self._claimed, self._cost
+        steps = [ (self._geom.neighbor_tables[d],self._geom.dir_distance(d)) for d in sorted(self._geom.neighbor_tables) ]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        while heap:
+            d,t = heappop(heap)
+            if d > dist[t]: continue  # a stale heap entry
+            c = cost(t)
+            if c is None and source[t] != t: continue  # nobody walks through walls (but a goal inside one is still a goal)
+            if c is None: c = 1
+            s = source[t]
+            for table,step in steps:
+                n = table[t]
+                if n < 0: continue
+                nd = d + step*c  # a critter on n would pay to step into t
+                if nd < dist[n] and cost(n) is not None:
+                    if dist[n] == INFINITY: self._reached += 1
+                    dist[n] = nd
+                    source[n] = s
+                    claimed[s].append(n)
+                    heappush(heap,(nd,n))
+
+
+
+
+class HierarchicalPathfinder:
+    """
+    Hierarchical pathfinding (HPA*) for big Level maps with a Rectangle8 geometry.
+    The map is cut into square clusters.  Wherever the border between two side-by-side clusters is open,
+    a pair of "entrance" tiles (one each side) joins an abstract graph, and the entrances of each cluster
+    are linked by the cost of the best route between them inside the cluster.  A query searches the small
+    abstract graph first and then fills in the route one cluster at a time, so its cost grows with the
+    number of clusters crossed rather than the number of tiles.  Paths are close to, but not always exactly,
+    the shortest.  A destination the Level's regions say can't be reached is turned down before any search.
+    (Openings that only connect two clusters diagonally through a corner aren't in the abstract graph; if it
+    finds no route between tiles that are connected, the search falls back to the geometry's own path_from_to.)
+    Each cluster is worked out the first time a search needs it.  When place_terrain() changes a tile,
+    only its cluster's entrances and the links of that cluster and its neighbors are thrown away.
+    """
+
+    def __init__(self,level,cluster_size=16,cost=None):
+        self._level = level
+        self._geom = level.geometry()
+        self._size = cluster_size
+        self._cost = cost or level.move_cost  # cost(tile): multiplier for entering a tile, or None if impassable
+        self._clusterrows = (self._geom.rows() + cluster_size - 1) // cluster_size
+        self._clustercols = (self._geom.cols() + cluster_size - 1) // cluster_size
+        self._borders = {}  # (cluster,cluster) -> list of (tile,tile) entrance pairs across the border between them
+        self._links = {}  # cluster -> { entrance tile: [(tile,cost),...] } edges of the abstract graph
+        self._paths = {}  # cluster -> { (entrance,entrance): [tiles] } routes between entrances that have been filled in
+        self._steps = [ (self._geom.neighbor_tables[d],self._geom.dir_distance(d)) for d in sorted(self._geom.neighbor_tables) ]
+        self.expanded = 0  # number of abstract nodes expanded by the most recent search
+        self._level.add_terrain_listener(self._terrain_changed)
+
+    def close(self):
+        # stop listening to the Level (call this when the pathfinder is no longer needed)
+        self._level.remove_terrain_listener(self._terrain_changed)
+
+    def clustercount(self):
+        return self._clusterrows * self._clustercols
+
+    def search(self,origin,destination):
+        "return a list of tile #s from origin to destination (both included), or None if there's no path"
+        if origin == destination: return [origin]
+        if self._cost(destination) is None: return None
+        if self._cost == self._level.move_cost and self._cost(origin) is not None:
+            # the regions are labelled by the Level's own costs; a False saves flooding the origin's whole region
+            if self._level.same_region(origin,destination) is False: return None
+        co, cd = self._cluster(origin), self._cluster(destination)
+        if abs(co[0]-cd[0]) <= 1 and abs(co[1]-cd[1]) <= 1:
+            # close by: a direct search of the clusters around the origin is cheap and gives the shortest path
+            r0,r1,c0,c1 = self._bounds( (co[0]-1,co[1]-1) )
+            r2,r3,c2,c3 = self._bounds( (co[0]+1,co[1]+1) )
+            dist,parent = self._local([origin],(max(r0,0),r3,max(c0,0),c3),{destination})
+            if destination in dist: return [origin] + self._trace(parent,origin,destination)
+
+        # temporarily join the origin and destination to the entrances of their clusters
+        origin_links = self._cluster_links(co)
+        targets = set(origin_links)
+        if co == cd: targets.add(destination)
+        dist,from_origin = self._local([origin],self._bounds(co),targets)
+        start = [ (t,dist[t]) for t in targets if t in dist and t != origin ] + origin_links.get(origin,[])
+        destination_links = self._cluster_links(cd)
+        dist,to_destination = self._local([destination],self._bounds(cd),set(destination_links),reverse=True)
+        finish = { t: dist[t] for t in destination_links if t in dist }
+
+        # A* over the abstract graph
+        estimate = self._geom.distance
+        g = { origin: 0.0 }
+        came_from = { origin: None }
+        openset = [ (estimate(origin,destination),0.0,origin) ]
+        closed = set()
+        while openset:
+            f,back,t = heapq.heappop(openset)
+            if t in closed: continue
+            if t == destination: break
+            closed.add(t)
+            if t == origin: edges = start
+            else: edges = self._cluster_links(self._cluster(t)).get(t,[])
+            if t in finish: edges = edges + [ (destination,finish[t]) ]
+            for n,c in edges:
+                ng = g[t] + c
+                if n not in closed and ng < g.get(n,INFINITY):
+                    g[n] = ng
+                    came_from[n] = t
+                    heapq.heappush(openset,(ng+estimate(n,destination),-ng,n)) # on ties, prefer the node furthest along
+        else:
+            # connected (or not known not to be) but only through a corner the abstract graph leaves out
+            self.expanded = len(closed)
+            return self._geom.path_from_to(origin,destination,self._cost)
+        self.expanded = len(closed)
+        abstract = []
+        t = destination
+        while t is not None:
+            abstract.append(t)
+            t = came_from[t]
+        abstract.reverse()
+
+        # fill in the steps between abstract nodes
+        path = [origin]
+        for a,b in zip(abstract,abstract[1:]):
+            if self._cluster(a) != self._cluster(b):
+                path.append(b) # one step across a border
+            elif a == origin:
+                path.extend( self._trace(from_origin,origin,b) )
+            elif b == destination:
+                while a != destination: # the reverse search's parents point towards the destination
+                    a = to_destination[a]
+                    path.append(a)
+            else:
+                path.extend( self._inner_path(a,b) )
+        return path
+
+    def _trace(self,parent,a,b):
+        # the steps from a to b, following a parent dictionary from b back to a
+        steps = []
+        while b != a:
+            steps.append(b)
+            b = parent[b]
+        steps.reverse()
+        return steps
+
+    def _inner_path(self,a,b):
+        # the steps from one entrance of a cluster to another, remembered until the cluster changes
+        cluster = self._cluster(a)
+        paths = self._paths.setdefault(cluster,{})
+        if (a,b) not in paths:
+            dist,parent = self._local([a],self._bounds(cluster),{b})
+            paths[(a,b)] = self._trace(parent,a,b)
+        return paths[(a,b)]
+
+    def _cluster(self,tile):
+        r,c = divmod(tile,self._geom.cols())
+        return r//self._size, c//self._size
+
+    def _bounds(self,cluster):
+        # first row, last row+1, first col, last col+1 of a cluster
+        cr,cc = cluster
+        s = self._size
+        return cr*s, min((cr+1)*s,self._geom.rows()), cc*s, min((cc+1)*s,self._geom.cols())
+
+    def _border_keys(self,cluster):
+        # the borders of a cluster, each one keyed by the two clusters it separates (lower or left one first)
+        cr,cc = cluster
+        keys = []
+        if cc+1 < self._clustercols: keys.append( ((cr,cc),(cr,cc+1)) )
+        if cc > 0: keys.append( ((cr,cc-1),(cr,cc)) )
+        if cr+1 < self._clusterrows: keys.append( ((cr,cc),(cr+1,cc)) )
+        if cr > 0: keys.append( ((cr-1,cc),(cr,cc)) )
+        return keys
+
+    def _entrances(self,key):
+        # the (tile,tile) pairs where the abstract graph crosses a border
+        if key in self._borders: return self._borders[key]
+        first, second = key
+        r0,r1,c0,c1 = self._bounds(first)
+        cols = self._geom.cols()
+        if first[0] == second[0]: pairs = [ (r*cols+c1-1, r*cols+c1) for r in range(r0,r1) ] # side by side
+        else: pairs = [ ((r1-1)*cols+c, r1*cols+c) for c in range(c0,c1) ] # one above the other
+        found = []
+        opening = [] # the current run of pairs that are open on both sides
+        for a,b in pairs + [(None,None)]:
+            if a is not None and self._cost(a) is not None and self._cost(b) is not None:
+                opening.append( (a,b) )
+            elif opening:
+                if len(opening) < 6: found.append( opening[len(opening)//2] ) # a narrow opening gets one entrance in the middle
+                else: found.extend( (opening[0],opening[-1]) ) # a wide one gets an entrance at each end
+                opening = []
+        self._borders[key] = found
+        return found
+
+    def _cluster_links(self,cluster):
+        # the abstract graph's edges from each entrance of a cluster: across its border, and to its other entrances
+        if cluster in self._links: return self._links[cluster]
+        across = self._geom.dir_distance(self._geom.EAST)
+        links = {}
+        for key in self._border_keys(cluster):
+            for a,b in self._entrances(key):
+                if key[1] == cluster: a,b = b,a # a is the entrance on this side
+                links.setdefault(a,[]).append( (b,across*self._cost(b)) )
+        bounds = self._bounds(cluster)
+        for a in list(links):
+            dist,parent = self._local([a],bounds,set(links))
+            links[a].extend( (b,dist[b]) for b in links if b != a and b in dist )
+        self._links[cluster] = links
+        return links
+
+    def _local(self,sources,bounds,targets,reverse=False):
+        # Dijkstra from the sources without leaving the bounds, stopping once all the targets are reached.
+        # Returns dictionaries of {tile: cost} and {tile: parent}.  With reverse=True the costs are for
+        # walking *to* the sources instead of from them.
+        r0,r1,c0,c1 = bounds
+        cols = self._geom.cols()
+        cost = self._cost
+        dist = {}
+        parent = {}
+        for s in sources:
+            dist[s] = 0.0
+            parent[s] = -1
+        heap = [ (0.0,s) for s in sources ]
+        remaining = set(targets)
+        while heap and remaining:
+            d,t = heapq.heappop(heap)
+            if d > dist[t]: continue
+            remaining.discard(t)
+            ct = cost(t)
+            for table,step in self._steps:
+                n = table[t]
+                if n < 0: continue
+                r,c = divmod(n,cols)
+                if not (r0 <= r < r1 and c0 <= c < c1): continue
+                cn = cost(n)
+                if cn is None: continue
+                nd = d + step*(ct if reverse else cn)
+                if nd < dist.get(n,INFINITY):
+                    dist[n] = nd
+                    parent[n] = t
+                    heapq.heappush(heap,(nd,n))
+        return dist, parent
+
+    def _terrain_changed(self,tile):
+        # forget everything that might depend on this tile; it will be worked out again when next needed
+        cr,cc = self._cluster(tile)
+        for cluster in ( (cr,cc), (cr+1,cc), (cr-1,cc), (cr,cc+1), (cr,cc-1) ):
+            self._links.pop(cluster,None)
+            self._paths.pop(cluster,None)
+        for key in self._border_keys( (cr,cc) ):
+            self._borders.pop(key,None)
+
+
+
+
+class PathCache:
+    """
+    Remembers recent path_from_to() results for a Level, keyed by (origin, destination, cost profile), and
+    forgets the least recently used ones once it holds 'size' paths.  It listens to the Level's terrain changes
+    (the listener feed, not the terrain_changes queue the Viewport pops from) and drops any cached path that
+    steps on a changed tile; remembered "no path" answers are dropped on any change at all.  A cached path stays
+    walkable until then, though a change elsewhere may have opened up a shorter one.
+    Counters of hits, misses, invalidations and evictions are kept to help choose the size.
+    """
+
+    def __init__(self,level,size=256):
+        self._level = level
+        self._size = size
+        self._entries = OrderedDict() # key -> tuple of tiles (or None), least recently used first
+        self._on_tile = defaultdict(set) # tile -> keys of the cached paths that step on it
+        self._no_path = set() # keys of cached "no path" answers
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._level.add_terrain_listener(self._terrain_changed)
+
+    def close(self):
+        # stop listening to the Level (call this when the cache is no longer needed)
+        self._level.remove_terrain_listener(self._terrain_changed)
+
+    def path_from_to(self,origin,destination,cost=None,profile=None):
+        """
+        Return the path from origin to destination (as the geometry's path_from_to would), from the cache if possible.
+        'profile' names the kind of mover the cost callback describes; by default the callback itself is the key.
+        """
+        if cost is None: cost = self._level.move_cost
+        key = ( origin, destination, profile if profile is not None else cost )
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            path = self._entries[key]
+            if path is None: return None
+            else: return list(path)
+        self.misses += 1
+        path = self._level.geometry().path_from_to(origin,destination,cost)
+        self._store(key,path)
+        return path
+
+    def stats(self):
+        return { "size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                 "invalidations": self.invalidations, "evictions": self.evictions }
+
+    def clear(self):
+        for key in list(self._entries): self._forget(key)
+
+    def _store(self,key,path):
+        if path is None:
+            self._entries[key] = None
+            self._no_path.add(key)
+        else:
+            self._entries[key] = tuple(path)
+            for t in path: self._on_tile[t].add(key)
+        while len(self._entries) > self._size:
+            self._forget( next(iter(self._entries)) )
+            self.evictions += 1
+
+    def _forget(self,key):
+        path = self._entries.pop(key)
+        if path is None:
+            self._no_path.discard(key)
+        else:
+            for t in path:
+                keys = self._on_tile[t]
+                keys.discard(key)
+                if not keys: del self._on_tile[t]
+
+    def _terrain_changed(self,tile):
+        stale = list(self._no_path)
+        if tile in self._on_tile: stale.extend(self._on_tile[tile])
+        for key in stale:
+            self._forget(key)
+            self.invalidations += 1
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry
+    rect = geometry.Rectangle8(10,10)
+    walls = set(rect.rectangle(rect.tile_at_coords(0,5),9,1))  # a wall with a gap at the top
+    print( rect.path_from_to(0,9,lambda t: None if t in walls else 1) )
+    hexes = geometry.HexVertical(10,9)
+    print( hexes.path_from_to(0,hexes.tilecount()-1) )
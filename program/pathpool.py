@@ -0,0 +1,113 @@
+"solving many walking paths at once on a pool of worker processes"
+from array import array
+from multiprocessing import Pool, RawArray
+import os
+import geometry, pathfinding
+
+
+
+class BatchPathSolver:
+    """
+    Finds the walking paths for a whole batch of (origin,destination) pairs on a Level with a Rectangle8
+    geometry, spread over a multiprocessing pool.  The workers share one read-only snapshot of the map:
+    a passability buffer (one byte per tile, 1 = passable) in shared memory (a multiprocessing.RawArray,
+    handed to each worker when the pool starts it), plus the map's dimensions,
+    so nothing but tile #s and paths goes back and forth for each batch.  The solver listens to the Level
+    and copies the tiles that have changed into the buffer before the next batch (the terrain "version"
+    goes up by one each time that happens); between batches no worker is running, so none can see it
+    half-written.  Call close() (or use a with block) to shut the pool down and free the shared memory.
+    """
+
+    def __init__(self,level,processes=None):
+        self._level = level
+        geom = level.geometry()
+        self._cols, self._rows = geom.cols(), geom.rows()
+        n = geom.tilecount()
+        self._passable = RawArray( "B", bytes( 0 if level.move_cost(t) is None else 1 for t in range(n) ) )
+        self._changed = set() # tiles whose terrain changed since the buffer was last brought up to date
+        self.version = 0
+        self._processes = processes or os.cpu_count() or 1
+        self._pool = Pool( self._processes, initializer=_start_worker, initargs=(self._passable,self._cols,self._rows) )
+        self._level.add_terrain_listener(self._terrain_changed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def close(self):
+        if self._pool is None: return
+        self._level.remove_terrain_listener(self._terrain_changed)
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+        self._passable = None
+
+    def solve(self,pairs):
+        """
+        Return a list with one entry per (origin,destination) pair: an array('l') of the tile #s on the
+        shortest walking path (both ends included), or None if there's no path.
+        """
+        self._sync()
+        pairs = list(pairs)
+        results = [None]*len(pairs)
+        todo = [] # (index,origin,destination) for the pairs that might have a path
+        for i,(o,d) in enumerate(pairs):
+            if self._level.same_region(o,d) is False and self._level.move_cost(o) is not None: continue # can't be reached
+            todo.append( (i,o,d) )
+        if not todo: return results
+        # a few batches per process, so a slow batch doesn't leave the other processes idle
+        size = max( 1, -(-len(todo) // (self._processes*4)) )
+        batches = [ todo[k:k+size] for k in range(0,len(todo),size) ]
+        for batch in self._pool.imap_unordered(_solve_batch,batches):
+            for i,path in batch: results[i] = path
+        return results
+
+    def _terrain_changed(self,tile):
+        self._changed.add(tile)
+
+    def _sync(self):
+        # bring the shared passability buffer up to date with the Level
+        if not self._changed: return
+        buf = self._passable
+        for t in self._changed:
+            buf[t] = 0 if self._level.move_cost(t) is None else 1
+        self._changed = set()
+        self.version += 1
+
+
+
+
+# The rest runs in the worker processes.  Each worker attaches to the shared buffer once, when it starts,
+# and keeps a geometry and a jump point search of its own for all the batches it's given.
+_worker = {}
+
+def _start_worker(passable,cols,rows):
+    geom = geometry.Rectangle8(cols,rows)
+    def cost(tile):
+        return 1 if passable[tile] else None
+    cost.uniform = True
+    _worker.update( geom=geom, cost=cost, finder=pathfinding.JumpPointSearch(geom) )
+
+def _solve_batch(batch):
+    finder, cost = _worker["finder"], _worker["cost"]
+    out = []
+    for i,o,d in batch:
+        path = finder.search(o,d,cost)
+        out.append( (i, None if path is None else array('l',path)) )
+    return out
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import random, time, gamedata
+    level = gamedata.Level( geometry.Rectangle8(200,200), gamedata.Grass() )
+    for t in random.sample(range(40000),8000): level.place_terrain( gamedata.Wall(), t )
+    pairs = [ (random.randrange(40000),random.randrange(40000)) for i in range(400) ]
+    with BatchPathSolver(level) as solver:
+        start = time.perf_counter()
+        paths = solver.solve(pairs)
+        print( sum(p is not None for p in paths), "paths in", round(time.perf_counter()-start,2), "s" )
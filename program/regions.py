@@ -0,0 +1,151 @@
+"connectivity: which passable tiles of a Level can reach each other"
+from collections import deque
+
+
+
+class RegionMap:
+    """
+    Labels the connected regions of passable tiles on a Level, so same_region(a,b) can tell in (almost) O(1)
+    whether any path between two tiles exists, without searching for one.
+    Every passable tile carries a region id, and the ids are joined by a small union-find: opening a tile
+    just merges the regions around it.  Closing a tile may cut a region in two, so the tiles around it are
+    flooded outwards in lockstep until they either meet again (nothing to do) or all but one of the floods
+    run out of tiles; the pieces that ran out are relabelled, which only costs their own size.
+    The labels are worked out on the first query and then kept up to date by listening to the Level.
+    """
+
+    def __init__(self,level,cost=None):
+        self._level = level
+        self._geom = level.geometry()
+        self._cost = cost or level.move_cost  # cost(tile): None if the tile is impassable
+        self._label = None  # region id of each tile (-1 if impassable), made on the first query
+        self._parent = []  # union-find over region ids
+        self._level.add_terrain_listener(self._terrain_changed)
+
+    def close(self):
+        # stop listening to the Level (call this when the RegionMap is no longer needed)
+        self._level.remove_terrain_listener(self._terrain_changed)
+
+    def region(self,tile):
+        "return the id of the region a tile belongs to, or None if the tile is impassable"
+        if self._label is None: self._build()
+        if self._label[tile] < 0: return None
+        return self._find(self._label[tile])
+
+    def same_region(self,a,b):
+        "return True if tiles a and b are both passable and connected to each other"
+        ra = self.region(a)
+        return ra is not None and ra == self.region(b)
+
+    def regioncount(self):
+        # the number of distinct regions (this one looks at every tile)
+        if self._label is None: self._build()
+        return len({ self._find(r) for r in self._label if r >= 0 })
+
+    def _build(self):
+        # flood fill every region from scratch
+        self._label = self._geom.tile_store(-1,'l')
+        self._parent = []
+        for t in range(self._geom.tilecount()):
+            if self._label[t] < 0 and self._cost(t) is not None:
+                self._flood(t,self._new_region())
+
+    def _flood(self,start,region):
+        self._label[start] = region
+        queue = deque([start])
+        while queue:
+            for n in self._geom.neighbors(queue.popleft()):
+                if self._label[n] != region and self._cost(n) is not None:
+                    self._label[n] = region
+                    queue.append(n)
+
+    def _new_region(self):
+        self._parent.append(len(self._parent))
+        return len(self._parent) - 1
+
+    def _find(self,region):
+        parent = self._parent
+        while parent[region] != region:
+            parent[region] = parent[parent[region]]  # path halving
+            region = parent[region]
+        return region
+
+    def _terrain_changed(self,tile):
+        if self._label is None: return  # nothing has been asked yet, so there's nothing to keep up to date
+        was_open = self._label[tile] >= 0
+        is_open = self._cost(tile) is not None
+        if is_open and not was_open: self._open(tile)
+        elif was_open and not is_open: self._close(tile)
+
+    def _open(self,tile):
+        # the tile joins (and joins together) whatever regions are next to it
+        roots = { self._find(self._label[n]) for n in self._geom.neighbors(tile) if self._label[n] >= 0 }
+        if not roots:
+            self._label[tile] = self._new_region()
+            return
+        keep = roots.pop()
+        for r in roots:
+            self._parent[r] = keep
+        self._label[tile] = keep
+
+    def _close(self,tile):
+        # the tile leaves its region, which may fall apart into pieces around it
+        self._label[tile] = -1
+        starts = [ n for n in self._geom.neighbors(tile) if self._label[n] >= 0 ]
+        if len(starts) < 2: return
+        # one flood per neighbor; floods that touch merge (a little union-find over the floods)
+        owner = {}  # tile -> flood that reached it
+        merged = list(range(len(starts)))
+        def flood_of(i):
+            while merged[i] != i: i = merged[i]
+            return i
+        queues = {}  # live flood -> tiles to expand
+        reached = {}  # flood -> the tiles it has reached
+        for i,s in enumerate(starts):
+            owner[s] = i
+            queues[i] = deque([s])
+            reached[i] = [s]
+        while len(reached) > 1 and len(queues) > 1:  # stop once all have met, or all but one have run out
+            for i in list(queues):
+                if i not in queues: continue  # merged away earlier in this round
+                queue = queues[i]
+                if not queue:
+                    del queues[i]  # this flood has found the whole of its piece
+                    continue
+                for n in self._geom.neighbors(queue.popleft()):
+                    if self._label[n] < 0: continue
+                    j = owner.get(n)
+                    if j is None:
+                        owner[n] = i
+                        queue.append(n)
+                        reached[i].append(n)
+                    else:
+                        j = flood_of(j)
+                        if j != i:
+                            # two floods met: they are one piece
+                            merged[j] = i
+                            queue.extend(queues.pop(j,()))
+                            reached[i].extend(reached.pop(j))
+        # Every flood still in 'reached' is a separate piece.  A piece still being flooded (there is at most
+        # one) keeps the old region id, since it may be huge; the pieces that were flooded completely get new ids.
+        pieces = list(reached)
+        if len(pieces) < 2: return
+        keep = next( iter(queues), pieces[0] )
+        for i in pieces:
+            if i == keep: continue
+            region = self._new_region()
+            for t in reached[i]: self._label[t] = region
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry, gamedata
+    level = gamedata.Level( geometry.Rectangle8(20,20), gamedata.Grass() )
+    regions = RegionMap(level)
+    print( regions.same_region(0,399), regions.regioncount() )
+    for r in range(20): level.place_terrain( gamedata.Wall(), level.geometry().tile_at_coords(r,10) )
+    print( regions.same_region(0,399), regions.regioncount() )
+    level.place_terrain( gamedata.Grass(), level.geometry().tile_at_coords(7,10) )
+    print( regions.same_region(0,399), regions.regioncount() )
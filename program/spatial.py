@@ -0,0 +1,134 @@
+"spatial indexes: finding the things and critters near a tile without probing every tile around it"
+import heapq
+
+
+
+class SpatialHash:
+    """
+    Buckets the objects on a Level by square blocks of bucket_size x bucket_size tiles, keyed by
+    (row // bucket_size, col // bucket_size).  Each bucket maps a tile # to the list of objects on it, so the
+    same object (e.g. a shared PlantType) may sit on many tiles.  A query only looks at the buckets that
+    overlap the area it covers, so its cost follows how many objects are nearby rather than the area.
+    Distances are the geometry's own distance(); the search relies on a step never changing the row or
+    the column by more than one, which holds for Rectangle8 and HexVertical.
+    """
+
+    def __init__(self,geom,bucket_size=8):
+        self._geom = geom
+        self._size = bucket_size
+        self._buckets = {} # (bucket row, bucket col) -> { tile: [objects] }
+        self._count = 0
+        self.scanned = 0 # objects looked at by queries so far (handy for profiling)
+
+    def __len__(self):
+        return self._count
+
+    def insert(self,obj,tile):
+        bucket = self._buckets.setdefault(self._key(tile),{})
+        bucket.setdefault(tile,[]).append(obj)
+        self._count += 1
+
+    def remove(self,obj,tile):
+        # take one copy of obj off a tile (raises ValueError if it isn't there, like list.remove)
+        key = self._key(tile)
+        bucket = self._buckets.get(key,{})
+        if obj not in bucket.get(tile,()): raise ValueError("object not indexed at tile %d" % tile)
+        bucket[tile].remove(obj)
+        if not bucket[tile]:
+            del bucket[tile]
+            if not bucket: del self._buckets[key]
+        self._count -= 1
+
+    def move(self,obj,origin,destination):
+        self.remove(obj,origin)
+        self.insert(obj,destination)
+
+    def within(self,origin,radius,tag=None,accept=None):
+        """
+        Return a list of (tile,object) pairs for the objects no more than radius away from the origin tile,
+        nearest first.  If a tag is given, only objects carrying that tag are included, and if accept is
+        given, only objects for which accept(object) is true.
+        """
+        found = []
+        reach = int(radius)
+        for key in self._keys_around(origin,reach):
+            for d,t,obj in self._scan(self._buckets.get(key),origin,tag,accept):
+                if d <= radius: found.append( (d,t,obj) )
+        found.sort(key=lambda entry: entry[0])
+        return [ (t,obj) for d,t,obj in found ]
+
+    def nearest(self,origin,k=1,tag=None,max_radius=None,accept=None):
+        """
+        Return a list of up to k (tile,object) pairs for the objects nearest to the origin tile, nearest first.
+        Buckets are searched in rings outwards from the origin's bucket; the search stops once the k found so
+        far are closer than anything in the next ring could be, or once max_radius (if given) is passed.
+        """
+        r,c = self._geom.row(origin), self._geom.col(origin)
+        br,bc = r // self._size, c // self._size
+        # how far the last row/col of the map is, in buckets, so the rings stop at the edge of the map
+        last_ring = max( br, bc, (self._geom.rows()-1)//self._size - br, (self._geom.cols()-1)//self._size - bc )
+        best = [] # heap of (-distance, tiebreak, tile, object): the k nearest so far, farthest on top
+        counter = 0
+        for ring in range(last_ring+1):
+            # nothing in this ring can be closer than the gap between the origin and the ring's inner edge
+            gap = min( r - (br-ring+1)*self._size + 1, (br+ring)*self._size - r, c - (bc-ring+1)*self._size + 1, (bc+ring)*self._size - c ) if ring else 0
+            if max_radius is not None and gap > max_radius: break
+            if len(best) == k and gap > -best[0][0]: break
+            for key in self._ring(br,bc,ring):
+                for d,t,obj in self._scan(self._buckets.get(key),origin,tag,accept):
+                    if max_radius is not None and d > max_radius: continue
+                    counter += 1
+                    if len(best) < k: heapq.heappush(best,(-d,counter,t,obj))
+                    elif d < -best[0][0]: heapq.heapreplace(best,(-d,counter,t,obj))
+        best.sort(key=lambda entry: (-entry[0],entry[1]))
+        return [ (t,obj) for d,n,t,obj in best ]
+
+    def _scan(self,bucket,origin,tag,accept=None):
+        # yield (distance,tile,object) for the objects in a bucket, leaving out those without the tag or not accepted
+        if not bucket: return
+        for t,objs in bucket.items():
+            d = None
+            for obj in objs:
+                self.scanned += 1
+                if tag is not None and tag not in getattr(obj,"_tags",()): continue
+                if accept is not None and not accept(obj): continue
+                if d is None: d = self._geom.distance(origin,t)
+                yield d,t,obj
+
+    def _key(self,tile):
+        return self._geom.row(tile) // self._size, self._geom.col(tile) // self._size
+
+    def _keys_around(self,origin,reach):
+        # the keys of every bucket holding a tile within reach rows and columns of the origin
+        r,c = self._geom.row(origin), self._geom.col(origin)
+        for kr in range( (r-reach)//self._size, (r+reach)//self._size + 1 ):
+            for kc in range( (c-reach)//self._size, (c+reach)//self._size + 1 ):
+                yield kr,kc
+
+    def _ring(self,br,bc,ring):
+        # the keys of the buckets 'ring' buckets away from (br,bc), i.e. the edge of a square of them
+        if ring == 0:
+            yield br,bc
+            return
+        for kc in range(bc-ring,bc+ring+1):
+            yield br-ring,kc
+            yield br+ring,kc
+        for kr in range(br-ring+1,br+ring):
+            yield kr,bc-ring
+            yield kr,bc+ring
+
+
+
+
+if __name__ == "__main__":
+    "UNIT TEST CODE"
+    import geometry
+    class Apple:
+        _tags = ["food"]
+    class Rock:
+        _tags = []
+    geom = geometry.Rectangle8(100,100)
+    index = SpatialHash(geom)
+    for t in range(0,10000,37): index.insert( Apple() if t % 3 else Rock(), t )
+    print( index.nearest(5050,k=3,tag="food") )
+    print( len(index.within(5050,10)), index.scanned )
@@ -9,9 +9,22 @@ import geometry, gamedata, tiles
 # that need updating.  Call the Level's .refresh() method to flag all tiles as
 # having changed, if you want to re-render all sprites from scratch: for example,
 # if you have plugged in a new tileset.
+#
+# The visible part of the map is kept as a geometry.TileRect (a corner and a size)
+# rather than a set of tile numbers, so scrolling only deals in the row spans that
+# come into or go out of view.
 
 
 
+def flagged(tilerange,changes):
+    "return the set of tiles in tilerange (a set, TileRect or TileSpans) that are also in the set of changes"
+    if not changes: return set()
+    if isinstance(changes,geometry.TileSet) and isinstance(tilerange,(geometry.TileRect,geometry.TileSpans)):
+        return set( changes.tiles_in(tilerange) ) # only the bitmap's bytes under the visible row spans are read
+    # walk whichever side is smaller and test membership in the other
+    if len(changes) < len(tilerange): return { t for t in changes if t in tilerange }
+    return { t for t in tilerange if t in changes }
+
 
 
 class Viewport:
@@ -50,12 +63,12 @@ class Viewport:
         self._critter_group = pyglet.graphics.OrderedGroup(2)
         self._cursor_group = pyglet.graphics.OrderedGroup(5)
         # arrays to hold the sprites -- there's a maximum of one sprite per tile per layer
-        self._terraintiles = [None]*self._level.geometry().tilecount()
-        self._thingtiles = [None]*self._level.geometry().tilecount()
-        self._crittertiles = [None]*self._level.geometry().tilecount()
+        self._terraintiles = self._level.geometry().tile_store(None)
+        self._thingtiles = self._level.geometry().tile_store(None)
+        self._crittertiles = self._level.geometry().tile_store(None)
 
         #the tiles that SHOULD be visible are the only ones we care about
-        self._visible_set = self._level.geometry().viewport( self._corner_row, self._corner_col, self._visible_rows, self._visible_cols )
+        self._visible_rect = self._level.geometry().view_rect( self._corner_row, self._corner_col, self._visible_rows, self._visible_cols )
 
         #initialize cursor
         self._cursor = None
@@ -64,10 +77,10 @@ class Viewport:
         self._batch.draw()
      
     def render(self,tilerange=None):
-        if tilerange==None: tilerange = self._visible_set # by default, render only the visible tiles
+        if tilerange==None: tilerange = self._visible_rect # by default, render only the visible tiles
         "create or delete sprites in those tiles where there have been changes since the last render()"
 
-        terrains_todo = tilerange & self._level.terrain_changes # the intersection of "visible in viewport" and "needs updating"
+        terrains_todo = flagged(tilerange, self._level.terrain_changes) # the intersection of "visible in viewport" and "needs updating"
         while terrains_todo:
             t = terrains_todo.pop()
             self._level.terrain_changes.remove(t) # remove t from the queue of tiles flagged to be updated
@@ -78,7 +91,7 @@ class Viewport:
             terrain = self._level.terrain(t)
             self._terraintiles[t] = pyglet.sprite.Sprite( terrain.image(), x, y, batch=self._batch, group=self._terrain_group )
             
-        things_todo = tilerange & self._level.thing_changes
+        things_todo = flagged(tilerange, self._level.thing_changes)
         while things_todo:
             t = things_todo.pop()
             self._level.thing_changes.remove(t) # remove t from the queue of tiles flagged to be updated
@@ -91,7 +104,7 @@ class Viewport:
                 y += self._y_margin + self._y_offset
                 self._thingtiles[t] = pyglet.sprite.Sprite( thing.image(), x, y, batch=self._batch, group=self._thing_group )
                 
-        critters_todo = tilerange & self._level.critter_changes 
+        critters_todo = flagged(tilerange, self._level.critter_changes)
         while critters_todo:
             t = critters_todo.pop()
             self._level.critter_changes.remove(t) # remove t from the queue of tiles flagged to be updated
@@ -183,10 +196,10 @@ class Viewport:
         self._x_offset = (-1)*(self._corner_col*tiles.tilewidth)
         self._y_offset = (-1)*(self._corner_row*tiles.tileheight)
         # determine which sprites are now visible
-        new_visible_set = self._level.geometry().viewport( self._corner_row, self._corner_col, self._visible_rows, self._visible_cols )
+        new_visible_rect = self._level.geometry().view_rect( self._corner_row, self._corner_col, self._visible_rows, self._visible_cols )
         
         # render and reveal the ones that are NEWLY visible
-        to_reveal = new_visible_set - self._visible_set
+        to_reveal = new_visible_rect - self._visible_rect # a few row spans
         self.render(to_reveal) # render changes to the newly visible tiles; if never viewed before, this will create the sprites
         for t in to_reveal:
             self._terraintiles[t].visible = True
@@ -194,14 +207,14 @@ class Viewport:
             if self._crittertiles[t]: self._crittertiles[t].visible = True
             
         # hide the ones that are NEWLY invisible
-        to_hide = self._visible_set - new_visible_set
+        to_hide = self._visible_rect - new_visible_rect
         for t in to_hide:
             self._terraintiles[t].visible = False
             if self._thingtiles[t]: self._thingtiles[t].visible = False
             if self._crittertiles[t]: self._crittertiles[t].visible = False                
         
         # move every now-visible sprite to its new x,y location
-        for t in new_visible_set:
+        for t in new_visible_rect:
             x,y = self._level.geometry().raw_xy(t,tiles.tilewidth,tiles.tileheight)
             x += self._x_margin + self._x_offset
             y += self._y_margin + self._y_offset
@@ -215,7 +228,7 @@ class Viewport:
                 self._crittertiles[t].y = y
 
         # finally
-        self._visible_set = new_visible_set
+        self._visible_rect = new_visible_rect
         self.adjust_cursor() # if there's a cursor, change its x,y position accordingly
 
     def resize_view(self,new_rows,new_cols,x_margin=0,y_margin=0):
@@ -228,10 +241,10 @@ class Viewport:
         corner_col = min( self._corner_col, self._level.geometry().cols() - self._visible_cols )  # and self._visible_cols to the left of the map's right edge
         
         # now determine the new viewport
-        new_visible_set = self._level.geometry().viewport( corner_row, corner_col, self._visible_rows, self._visible_cols )
+        new_visible_rect = self._level.geometry().view_rect( corner_row, corner_col, self._visible_rows, self._visible_cols )
 
         # render and reveal NEWLY visible tiles
-        to_reveal = new_visible_set - self._visible_set
+        to_reveal = new_visible_rect - self._visible_rect # a few row spans
         self.render(to_reveal) # render changes to the newly visible tiles; if never viewed before, this will create the sprites
         for t in to_reveal:
             self._terraintiles[t].visible = True
@@ -239,7 +252,7 @@ class Viewport:
             if self._crittertiles[t]: self._crittertiles[t].visible = True
 
         # hide the tiles that are newly INvisible
-        to_hide = self._visible_set - new_visible_set
+        to_hide = self._visible_rect - new_visible_rect
         for t in to_hide:
             self._terraintiles[t].visible = False
             if self._thingtiles[t]: self._thingtiles[t].visible = False
@@ -259,7 +272,7 @@ class Viewport:
         self._y_margin = y_margin
             
         # move every now-visible sprite to its new x,y location
-        for t in new_visible_set:
+        for t in new_visible_rect:
             x,y = self._level.geometry().raw_xy(t,tiles.tilewidth,tiles.tileheight)
             x += self._x_margin + self._x_offset
             y += self._y_margin + self._y_offset
@@ -272,8 +285,8 @@ class Viewport:
                 self._crittertiles[t].x = x
                 self._crittertiles[t].y = y
 
-        # remember the new _visible_set
-        self._visible_set = new_visible_set
+        # remember the new _visible_rect
+        self._visible_rect = new_visible_rect
 
         # TODO: finally,if there's a cursor active, and it's not in the new viewport, move the view.
         self.check_cursor_outofbounds()
@@ -338,8 +351,8 @@ class Viewport:
             #adjustments to make the math work
             move = moveto-1
             # don't act unless the cursor is outside of the visible set
-            acceptable_set = self._level.geometry().viewport(self._corner_row+trigger,self._corner_col+trigger,self._visible_rows-(2*trigger),self._visible_cols-(2*trigger))
-            if self._cursor_tilenum in acceptable_set:
+            acceptable_rect = self._level.geometry().view_rect(self._corner_row+trigger,self._corner_col+trigger,self._visible_rows-(2*trigger),self._visible_cols-(2*trigger))
+            if self._cursor_tilenum in acceptable_rect:
                 return False # no move needed
             else:
                 cursor_row = self._level.geometry().row(self._cursor_tilenum)
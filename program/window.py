@@ -1,6 +1,6 @@
 import preferences # this first import will load the user's preferences from prefs.txt
 import tiles # this is the first import of tiles.py so it will take some time initializing graphics
-import widgets, viewport, worldgen, geometry
+import widgets, viewport, worldgen, geometry, jobs
 import pyglet
 from pyglet.window import key
 
@@ -21,6 +21,9 @@ class GameWindow( pyglet.window.Window ):
     def __init__( self, **kargs ):
         self._modes = [] # this variable will hold the "stack" of game input/output modes
         pyglet.window.Window.__init__( self, **kargs )
+        # long-running work (e.g. critters' pathfinding) goes here, to be run a few milliseconds per frame
+        self.jobs = jobs.JobScheduler()
+        self.jobs.start()
 
     def change_bottom_mode( self, gamemode ):
         """
@@ -1,9 +1,11 @@
 "generate a new gamedata object"
 
-import gamedata, geometry, random, tiles
-import pyglet
-pyglet.resource.path = ['program/resources/info','resources/info','program/resources/tiles','resources/tiles'] 
-import sys
+import gamedata, geometry, random
+import os, sys
+from debug import error_log
+
+# the info files are read straight from disk, so a world can be generated without pyglet or a display
+info_path = os.path.join( os.path.dirname(os.path.abspath(__file__)), "resources", "info" )
 
 
 def gen_world():
@@ -12,23 +14,25 @@ def gen_world():
     gdata = gamedata.GameData( geometry.Rectangle8(100,100), terraintypes[1] )  #terraintypes[1] is green grass;
     
     
-    btiles = [] #an array of all "building tiles" so far
+    geom = gdata.level().geometry()
+    btiles = geom.tile_set() #a mask of all "building tiles" so far
     i = 0;
     while i < 30 :
         # generate rectangles of walls with tile floors inside
-        nextrect = gdata.level().geometry().rectangle( gdata.level().geometry().randomtile(), 9, 9 )
-        if len([val for val in nextrect if val in btiles]) == 0:
+        roommask = geom.rectangle_mask( geom.randomtile(), 9, 9 )
+        if not (roommask & btiles):
             # only build a room if this doesn't intersect an existing room
-            for t in nextrect:
-                btiles.append(t)
-            inside_corner = gdata.level().geometry().adjacent(nextrect[0],geometry.AbstractGeometry.NE)
+            btiles |= roommask
+            nextrect = geom.tiles_in_mask(roommask)
+            inside_corner = geom.adjacent(nextrect[0],geometry.AbstractGeometry.NE)
             if inside_corner:
                 #this will fail if the building starts at the top or right edge of the map, so there is no "inside"
-                interior = gdata.level().geometry().rectangle( inside_corner, 7, 7 )
-                for t in interior:
+                interiormask = geom.rectangle_mask( inside_corner, 7, 7 )
+                for t in geom.tiles_in_mask(interiormask):
                     gdata.create_terrain( terraintypes[2], tile=t ) #terraintypes[2] is a tile floor
-                # now remove the interior tiles from 'nextrect' so we just have a list of wall tiles
-                nextrect = [val for val in nextrect if not val in interior]
+                # now remove the interior tiles from the room so we just have the wall tiles
+                roommask = roommask - interiormask
+            nextrect = list( geom.tiles_in_mask(roommask) )
             for t in nextrect:
                 gdata.create_terrain( terraintypes[0], tile=t ) #terraintypes[0] is the brick wall
             # now create a doorway
@@ -41,12 +45,12 @@ def gen_world():
     for i in range(1000):
         # generate a thousand shrubberies
         t = gdata.level().geometry().randomtile()
-        if not "built" in gdata.level().terrain(t)._tags:
+        if not gdata.level().is_built(t):
             gdata.create_thing( random.choice(planttypes),tile=t )
 	
 	#pick a random tile for the player and tell the GameData to initialize him there
     ptile = gdata.level().geometry().randomtile()
-    while "built" in gdata.level().terrain(ptile)._tags: # don't let the player start indoors
+    while gdata.level().is_built(ptile): # don't let the player start indoors
         ptile = gdata.level().geometry().randomtile()
     gdata.init_player_at(ptile)
     
@@ -57,7 +61,7 @@ def generate_terrain():
     # read the terrain.txt file, generate terrain as gamedata.TerrainTypes
     print("Generating terrain.",end="")
     terraintypes = []
-    terrainsfile = pyglet.resource.file('terrains.txt',"r")
+    terrainsfile = open( os.path.join(info_path,'terrains.txt'), "r" )
     for line in terrainsfile:
         line = line.strip().lower()
         if line.find("#") > -1: line = line[:line.find("#")] # ignore comments beginning with "#"
@@ -66,7 +70,7 @@ def generate_terrain():
             data = line.split(":")
             if len(data) == 3:
                 # 3 items expected
-                terraintypes.append( gamedata.TerrainType( data[0].strip(), tiles.tiles[data[1].strip()], data[2].strip() ) ) # create the TerrainType
+                terraintypes.append( gamedata.TerrainType( data[0].strip(), data[1].strip(), data[2].strip() ) ) # create the TerrainType
                 print(".",end="")
                 sys.stdout.flush()
             else:
@@ -79,7 +83,7 @@ def generate_plantlife():
     # read the plants.txt file, generate plants as gamedata.PlantTypes
     print("Generating plants.",end="")
     planttypes = [] # a list of plant types
-    plantsfile = pyglet.resource.file('plants.txt',"r")
+    plantsfile = open( os.path.join(info_path,'plants.txt'), "r" )
     for line in plantsfile:
         line = line.strip().lower()
         if line.find("#") > -1: line = line[:line.find("#")] # remove first "#" and everything after
@@ -88,7 +92,7 @@ def generate_plantlife():
             data = line.split(":")
             if len(data) == 3:
                 # 3 items expected
-                planttypes.append( gamedata.PlantType( data[0].strip(), tiles.tiles[data[1].strip()], data[2].strip() ) ) #create the PlantType
+                planttypes.append( gamedata.PlantType( data[0].strip(), data[1].strip(), data[2].strip() ) ) #create the PlantType
                 print(".",end="")
                 sys.stdout.flush()
             else: